@@ -85,6 +85,7 @@ THIRD_PARTY_APPS = [
     "rest_framework",
     "rest_framework.authtoken",
     "corsheaders",
+    "django_filters",
     "drf_spectacular",
     "social_django",
 ]
@@ -292,6 +293,13 @@ REST_FRAMEWORK = {
     "DEFAULT_PERMISSION_CLASSES": ("rest_framework.permissions.IsAuthenticated",),
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
 }
+# Cursor pagination of the hkd endpoints
+HKD_PAGE_SIZE = env.int("DJANGO_HKD_PAGE_SIZE", default=100)
+HKD_MAX_PAGE_SIZE = env.int("DJANGO_HKD_MAX_PAGE_SIZE", default=1000)
+# Cached hkd reads are invalidated by the model signals, the TTL only evicts the stale entries
+HKD_API_CACHE_TTL = env.int("DJANGO_HKD_API_CACHE_TTL", default=24 * 3600)
+# The cached group names of a user are invalidated by the membership signals, the TTL is a safety net
+USERS_GROUP_NAMES_CACHE_TTL = env.int("DJANGO_USERS_GROUP_NAMES_CACHE_TTL", default=3600)
 
 # django-cors-headers - https://github.com/adamchainz/django-cors-headers#setup
 CORS_URLS_REGEX = r"^/api/.*$"
@@ -310,7 +318,28 @@ GRAFANA_API_URL = env("DJANGO_GRAFANA_API_URL")
 GRAFANA_AUTH_USERNAME = env("DJANGO_GRAFANA_AUTH_USERNAME", None)
 GRAFANA_AUTH_PASSWORD = env("DJANGO_GRAFANA_AUTH_PASSWORD", None)
 GRAFANA_AUTH_TOKEN = env("DJANGO_GRAFANA_AUTH_TOKEN", None)
+# HTTP client shared by the Grafana managers
+GRAFANA_POOL_SIZE = env.int("DJANGO_GRAFANA_POOL_SIZE", default=10)
+GRAFANA_MAX_RETRIES = env.int("DJANGO_GRAFANA_MAX_RETRIES", default=3)
+GRAFANA_BACKOFF_FACTOR = env.float("DJANGO_GRAFANA_BACKOFF_FACTOR", default=0.5)
+GRAFANA_TIMEOUT = env.float("DJANGO_GRAFANA_TIMEOUT", default=30.0)
+GRAFANA_MAX_WORKERS = env.int("DJANGO_GRAFANA_MAX_WORKERS", default=8)
+# Seconds the datasource and folder UIDs are kept in the cache
+GRAFANA_UID_CACHE_TTL = env.int("DJANGO_GRAFANA_UID_CACHE_TTL", default=3600)
 
 GRAFANA_ALERTS_FOLDER = "CCRES Alerts"
+# Alerts per rule group, the groups are per station, evaluation interval and range of alert ids
+GRAFANA_ALERTS_GROUP_SIZE = env.int("DJANGO_GRAFANA_ALERTS_GROUP_SIZE", default=20)
 INFLUX_DB_DATASOURCE_NAME = "InfluxDB"
 INFLUX_DB_BUCKET = "mybucket"
+
+# PROVISIONING QUEUE
+# ------------------------------------------------------------------------------
+# Redis used as the queue of Grafana provisioning jobs, the database is used when unset
+PROVISIONING_REDIS_URL = env("REDIS_URL", default=None)
+# Triggers of the same job within this window collapse into one sync
+PROVISIONING_COALESCE_SECONDS = env.float("DJANGO_PROVISIONING_COALESCE_SECONDS", default=5.0)
+PROVISIONING_RETRY_SECONDS = env.float("DJANGO_PROVISIONING_RETRY_SECONDS", default=60.0)
+PROVISIONING_POLL_SECONDS = env.float("DJANGO_PROVISIONING_POLL_SECONDS", default=1.0)
+# Run the jobs right after the commit instead of queueing them
+PROVISIONING_EAGER = env.bool("DJANGO_PROVISIONING_EAGER", default=False)
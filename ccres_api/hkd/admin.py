@@ -16,6 +16,7 @@ from .models import (
     Parameter,
     Preprocessing,
     Firmware,
+    ProvisioningJob,
 )
 
 # Register your models here.
@@ -131,3 +132,10 @@ class AlertDependencyAdmin(admin.ModelAdmin):
 
 
 admin.site.register(AlertDependency, AlertDependencyAdmin)
+
+
+class ProvisioningJobAdmin(admin.ModelAdmin):
+    list_display = ["kind", "key", "due_at"]
+
+
+admin.site.register(ProvisioningJob, ProvisioningJobAdmin)
@@ -9,3 +9,4 @@ class HkdConfig(AppConfig):
         import hkd.signals.create_dashboards  # noqa
         import hkd.signals.create_contact  # noqa
         import hkd.signals.create_alerts  # noqa
+        import hkd.signals.invalidate_cache  # noqa
@@ -0,0 +1,99 @@
+"""
+Cached reads of the hkd catalogues
+
+Each cached model has a version in the Django cache: the time of its last change, bumped by
+the save/delete signals (see `hkd.signals.invalidate_cache`). A cached response is keyed by
+the versions of the models it is built from, so a change makes the old entries unreachable
+instead of waiting for a TTL, and the ETag/Last-Modified of a response come from the
+versions alone: a conditional GET is answered with a 304 without querying the database.
+"""
+import hashlib
+import math
+import time
+from typing import Callable, Iterable, List, Type
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Model
+from django.utils.cache import patch_cache_control
+from django.utils.http import http_date, parse_etags, parse_http_date_safe, quote_etag
+from rest_framework import status
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+
+def _version_key(model: Type[Model]) -> str:
+    return f"hkd:api:version:{model._meta.label_lower}"
+
+
+def get_models_version(models: Iterable[Type[Model]]) -> float:
+    """Time of the last change of any of the models"""
+    keys = {_version_key(model): model for model in models}
+    versions = cache.get_many(keys)
+    for key in keys.keys() - versions.keys():
+        # Unknown version (cold or evicted cache): consider the model changed now
+        cache.add(key, time.time(), timeout=None)
+        versions[key] = cache.get(key, time.time())
+    return max(versions.values())
+
+
+def bump_model_version(model: Type[Model]):
+    cache.set(_version_key(model), time.time(), timeout=None)
+
+
+class CachedReadMixin:
+    """Cache the list and retrieve responses of a viewset until one of `cache_models` changes
+
+    The responses carry an ETag and a Last-Modified header, `If-None-Match` and
+    `If-Modified-Since` requests get a 304 when the models did not change since.
+    """
+
+    cache_models: List[Type[Model]] = []
+
+    def list(self, request: Request, *args, **kwargs) -> Response:
+        return self.cached_response(self.cache_models, super().list, request, *args, **kwargs)
+
+    def retrieve(self, request: Request, *args, **kwargs) -> Response:
+        return self.cached_response(self.cache_models, super().retrieve, request, *args, **kwargs)
+
+    def cached_response(
+        self, models: List[Type[Model]], handler: Callable[..., Response], request: Request, *args, **kwargs
+    ) -> Response:
+        if not models:
+            return handler(request, *args, **kwargs)
+
+        version = get_models_version(models)
+        # The links of the paginated responses are absolute, so is the key
+        content_key = f"{version}:{request.accepted_renderer.format}:{request.build_absolute_uri()}"
+        etag = quote_etag(hashlib.sha1(content_key.encode()).hexdigest())
+        # HTTP dates are in whole seconds, rounding down would date the response before the change
+        last_modified = math.ceil(version)
+        headers = {"ETag": etag, "Last-Modified": http_date(last_modified)}
+
+        if_none_match = request.headers.get("If-None-Match")
+        if_modified_since = parse_http_date_safe(request.headers.get("If-Modified-Since", ""))
+        if if_none_match is not None:
+            not_modified = etag in parse_etags(if_none_match) or if_none_match.strip() == "*"
+        else:
+            not_modified = if_modified_since is not None and last_modified <= if_modified_since
+        if not_modified:
+            return self._with_cache_headers(Response(status=status.HTTP_304_NOT_MODIFIED), headers)
+
+        cache_key = f"hkd:api:response:{etag}"
+        data = cache.get(cache_key)
+        if data is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            cache.set(cache_key, response.data, settings.HKD_API_CACHE_TTL)
+        else:
+            response = Response(data)
+        return self._with_cache_headers(response, headers)
+
+    @staticmethod
+    def _with_cache_headers(response: Response, headers: dict) -> Response:
+        for name, value in headers.items():
+            response[name] = value
+        # Clients keep the response but revalidate it on every use
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
@@ -0,0 +1,25 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from hkd.provisioning import run_pending
+
+
+class Command(BaseCommand):
+    help = "Run the queued Grafana provisioning jobs"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Run the due jobs once and exit",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            nb_jobs = run_pending()
+            if nb_jobs:
+                self.stdout.write(f"Ran {nb_jobs} provisioning job(s)")
+            if options["once"]:
+                return
+            time.sleep(settings.PROVISIONING_POLL_SECONDS)
@@ -4,3 +4,4 @@ from hkd.models.grafana import Grafana, GrafanaDashboard, GrafanaPanel
 from hkd.models.influxdb import Influx, InfluxSource
 from hkd.models.instrument import Instrument, InstrumentCategory, InstrumentModel, Station, Firmware
 from hkd.models.parameter import Parameter, Preprocessing
+from hkd.models.provisioning import ProvisioningJob
@@ -39,6 +39,11 @@ class Alert(models.Model):
 
     class Meta:
         verbose_name = "Alert of parameter information"
+        indexes = [
+            models.Index(fields=["title"]),
+            models.Index(fields=["message_level"]),
+            models.Index(fields=["parameter", "message_level"]),
+        ]
 
     def clean(self):
         minimum_conditions = [self.trigger_minimum, self.trigger_minimum_condition]
@@ -23,6 +23,7 @@ class AlertContact(models.Model):
 
     class Meta:
         verbose_name = "Contact for alerting"
+        indexes = [models.Index(fields=["email"])]
         unique_together = ("name", "email")
 
     def __str__(self):
@@ -20,6 +20,7 @@ class GrafanaDashboard(models.Model):
 
     class Meta:
         verbose_name = "Grafana dashboard information"
+        indexes = [models.Index(fields=["name"])]
 
     def __str__(self):
         return f"{self.name}"
@@ -32,6 +33,7 @@ class GrafanaPanel(models.Model):
 
     class Meta:
         verbose_name = "Grafana panel information"
+        indexes = [models.Index(fields=["dashboard", "name"])]
 
     def __str__(self):
         return f"{self.name}"
@@ -15,6 +15,7 @@ class Station(models.Model):
 
     class Meta:
         verbose_name = "Station"
+        indexes = [models.Index(fields=["name"])]
 
     def __str__(self):
         return f"{self.name}"
@@ -33,6 +34,7 @@ class InstrumentModel(models.Model):
 
     class Meta:
         verbose_name = "Model of an instrument"
+        indexes = [models.Index(fields=["model"])]
 
     def __str__(self):
         return f"{self.model}"
@@ -60,6 +62,10 @@ class Instrument(models.Model):
 
     class Meta:
         verbose_name = "Instrument of station"
+        indexes = [
+            models.Index(fields=["station", "is_active"]),
+            models.Index(fields=["instrument_model", "is_active"]),
+        ]
 
     def __str__(self):
         return f"{self.instrument_model.model} - {self.station.name} - {self.category.name}"
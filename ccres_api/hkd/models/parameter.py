@@ -12,6 +12,10 @@ class Parameter(models.Model):
 
     class Meta:
         verbose_name = "Parameter information"
+        indexes = [
+            models.Index(fields=["name"]),
+            models.Index(fields=["instrument_model", "name"]),
+        ]
 
     def __str__(self):
         return f"{self.name} - {self.instrument_model.model}"
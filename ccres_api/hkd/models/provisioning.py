@@ -0,0 +1,20 @@
+from django.db import models
+
+
+class ProvisioningJob(models.Model):
+    """Pending Grafana provisioning job
+
+    Used as the queue when no Redis is configured. A (kind, key) pair is stored
+    only once, so repeated triggers collapse into the job already waiting.
+    """
+
+    kind = models.CharField(max_length=100)
+    key = models.CharField(max_length=100)
+    due_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        verbose_name = "Pending Grafana provisioning job"
+        unique_together = ("kind", "key")
+
+    def __str__(self):
+        return f"{self.kind} - {self.key}"
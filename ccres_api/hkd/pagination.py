@@ -0,0 +1,16 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+
+class HkdCursorPagination(CursorPagination):
+    """Keyset pagination on the primary key
+
+    The cursor encodes the last primary key seen, so every page is a `WHERE pk > ... LIMIT n`
+    query and deep pages cost the same as the first one.
+    The page size can be changed per request with `?page_size=`, up to `HKD_MAX_PAGE_SIZE`.
+    """
+
+    ordering = "pk"
+    page_size = settings.HKD_PAGE_SIZE
+    page_size_query_param = "page_size"
+    max_page_size = settings.HKD_MAX_PAGE_SIZE
@@ -0,0 +1 @@
+from hkd.provisioning.queue import batch, enqueue, register, run_pending
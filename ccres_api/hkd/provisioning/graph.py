@@ -0,0 +1,116 @@
+"""
+Provisioning graph shared by the alert and dashboard generation
+
+Station -> Instrument -> InstrumentModel -> Parameter -> Alert, with the contact group
+of each instrument, loaded in a constant number of queries whatever the size of the fleet.
+"""
+from typing import Any, Dict, Iterable, List, Optional
+
+from django.db.models import Model, Prefetch
+from hkd.models import Alert, Instrument, InstrumentModel, Parameter, Station
+from hkd.provisioning.queue import batch_memo
+
+
+def load_provisioning_graph(station_ids: Optional[Iterable[str]] = None) -> List[Station]:
+    """Load the stations with their whole provisioning graph prefetched
+
+    Parameters
+    ----------
+    station_ids : Optional[Iterable[str]]
+        Only load these stations, by default every station
+
+    Returns
+    -------
+    List[Station]
+        Stations where `instrument_set`, `instrument.instrument_model`, `instrument.contact_group`,
+        `instrument_model.parameter_set` and `parameter.alert_set` are already loaded
+    """
+    stations = Station.objects.order_by("pk").prefetch_related(
+        Prefetch(
+            "instrument_set",
+            queryset=Instrument.objects.select_related(
+                "instrument_model", "contact_group"
+            ).order_by("pk"),
+        ),
+        Prefetch(
+            "instrument_set__instrument_model__parameter_set",
+            queryset=Parameter.objects.order_by("pk"),
+        ),
+        Prefetch(
+            "instrument_set__instrument_model__parameter_set__alert_set",
+            queryset=Alert.objects.order_by("pk"),
+        ),
+    )
+    if station_ids is not None:
+        stations = stations.filter(pk__in=station_ids)
+    return list(stations)
+
+
+def get_instrument_models(station: Station) -> List[InstrumentModel]:
+    """Instrument models of a station loaded by `load_provisioning_graph`, without duplicates"""
+    instrument_models = {}
+    for instrument in station.instrument_set.all():
+        instrument_models.setdefault(instrument.instrument_model_id, instrument.instrument_model)
+    return list(instrument_models.values())
+
+
+# Fields whose value before a save also decides the stations to sync
+TRACKED_FIELDS = {
+    Instrument: ["station_id", "instrument_model_id"],
+    Parameter: ["instrument_model_id"],
+    Alert: ["parameter_id"],
+}
+
+
+def get_previous_values(sender: Any, instance: Model) -> Dict[str, Any]:
+    """Values of the tracked fields of an instance as stored in the database, before it is saved"""
+    fields = TRACKED_FIELDS.get(sender)
+    if not fields or instance.pk is None:
+        return {}
+    return sender.objects.filter(pk=instance.pk).values(*fields).first() or {}
+
+
+def get_loaded_values(sender: Any, instance: Model) -> Dict[str, Any]:
+    """Values of the tracked fields of an instance loaded from the database, before it is changed
+
+    Used by the bulk updates, which skip `pre_save`, without a query per instance.
+    """
+    return {field: getattr(instance, field) for field in TRACKED_FIELDS.get(sender, [])}
+
+
+def get_affected_station_ids(sender: Any, instance: Any, previous: Optional[Dict[str, Any]] = None) -> List[int]:
+    """Stations whose folder, dashboards or alert rules change with the instance
+
+    - a station only needs its own folder, dashboards and rules
+    - an instrument changes its station, and its previous station when it moved
+    - an instrument model, a parameter or an alert changes the stations running that model,
+      and those running the previous model (or parameter) of the parameter (or alert)
+
+    `previous` holds the values of `TRACKED_FIELDS` before the save, see `get_previous_values`.
+    """
+    previous = previous or {}
+    if sender is Station:
+        return [instance.pk]
+    if sender is Instrument:
+        return list({instance.station_id, previous.get("station_id", instance.station_id)})
+
+    if sender is InstrumentModel:
+        lookup, ids = "instrument__instrument_model_id__in", {instance.pk}
+    elif sender is Parameter:
+        lookup = "instrument__instrument_model_id__in"
+        ids = {instance.instrument_model_id, previous.get("instrument_model_id")}
+    elif sender is Alert:
+        lookup = "instrument__instrument_model__parameter__in"
+        ids = {instance.parameter_id, previous.get("parameter_id")}
+    else:
+        return []
+
+    # In a batch the stations of a model (or parameter) are queried once for all the saved rows
+    key = (lookup, frozenset(ids - {None}))
+    memo = batch_memo()
+    if memo is not None and key in memo:
+        return memo[key]
+    station_ids = list(Station.objects.filter(**{lookup: key[1]}).distinct().values_list("pk", flat=True))
+    if memo is not None:
+        memo[key] = station_ids
+    return station_ids
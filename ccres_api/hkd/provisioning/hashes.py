@@ -0,0 +1,16 @@
+from typing import Optional
+
+from django.core.cache import cache
+
+
+class CacheHashStore:
+    """Hashes of the last pushed Grafana contents, kept in the Django cache without expiry"""
+
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[str]:
+        return cache.get(f"{self.prefix}:{key}")
+
+    def set(self, key: str, value: str) -> None:
+        cache.set(f"{self.prefix}:{key}", value, timeout=None)
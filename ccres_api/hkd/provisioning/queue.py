@@ -0,0 +1,187 @@
+"""
+Queue of the Grafana provisioning jobs
+
+The signals only enqueue jobs once the transaction is committed, a worker
+(`manage.py provisioning_worker`) then runs them outside of the request/response cycle.
+
+A job is a (kind, key) pair, e.g. ("alert_groups", "<station pk>"). The same pair is stored
+only once and is due `PROVISIONING_COALESCE_SECONDS` after its first trigger, so every
+trigger happening in that window collapses into one sync.
+Inside a `batch()` block the jobs are collected and enqueued once, at the end of the block.
+"""
+import datetime as dt
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from hkd.models import ProvisioningJob
+
+Job = Tuple[str, str]
+Handler = Callable[[List[str]], None]
+
+_HANDLERS: Dict[str, Handler] = {}
+_queue = None
+_batch = threading.local()
+
+logger = logging.getLogger(__name__)
+
+
+def register(kind: str) -> Callable[[Handler], Handler]:
+    """Register the handler of a kind of job
+
+    The handler receives the keys of all the due jobs of this kind at once.
+    """
+
+    def decorator(handler: Handler) -> Handler:
+        _HANDLERS[kind] = handler
+        return handler
+
+    return decorator
+
+
+class DatabaseJobQueue:
+    """Queue stored in the ProvisioningJob table"""
+
+    def push(self, kind: str, key: str, due_at: float):
+        ProvisioningJob.objects.get_or_create(
+            kind=kind,
+            key=key,
+            defaults={"due_at": dt.datetime.fromtimestamp(due_at, tz=dt.timezone.utc)},
+        )
+
+    def pop_due(self, limit: int = 1000) -> List[Job]:
+        with transaction.atomic():
+            jobs = list(
+                ProvisioningJob.objects.select_for_update(skip_locked=True)
+                .filter(due_at__lte=timezone.now())
+                .order_by("due_at")[:limit]
+            )
+            ProvisioningJob.objects.filter(pk__in=[job.pk for job in jobs]).delete()
+        return [(job.kind, job.key) for job in jobs]
+
+
+class RedisJobQueue:
+    """Queue stored in a Redis sorted set, scored by the due time"""
+
+    name = "hkd:provisioning:jobs"
+
+    def __init__(self, url: str):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+
+    def push(self, kind: str, key: str, due_at: float):
+        # NX keeps the due time of the job already waiting
+        self.client.zadd(self.name, {f"{kind}:{key}": due_at}, nx=True)
+
+    def pop_due(self, limit: int = 1000) -> List[Job]:
+        members = self.client.zrangebyscore(self.name, "-inf", time.time(), start=0, num=limit)
+        jobs = []
+        for member in members:
+            # Only the worker that removes the member runs the job
+            if not self.client.zrem(self.name, member):
+                continue
+            kind, key = member.decode().split(":", 1)
+            jobs.append((kind, key))
+        return jobs
+
+
+def get_queue():
+    global _queue
+    if _queue is None:
+        if settings.PROVISIONING_REDIS_URL:
+            _queue = RedisJobQueue(settings.PROVISIONING_REDIS_URL)
+        else:
+            _queue = DatabaseJobQueue()
+    return _queue
+
+
+def run_jobs(jobs: List[Job]):
+    """Run the jobs, grouping the keys of the same kind into one handler call"""
+    keys_by_kind: Dict[str, List[str]] = defaultdict(list)
+    for kind, key in jobs:
+        if key not in keys_by_kind[kind]:
+            keys_by_kind[kind].append(key)
+
+    for kind, keys in keys_by_kind.items():
+        handler = _HANDLERS.get(kind)
+        if handler is None:
+            logger.error("No handler registered for the provisioning jobs %s", kind)
+            continue
+        try:
+            handler(keys)
+        except Exception:
+            logger.exception("Provisioning jobs %s %s failed, retrying later", kind, keys)
+            due_at = time.time() + settings.PROVISIONING_RETRY_SECONDS
+            for key in keys:
+                get_queue().push(kind, key, due_at)
+
+
+def run_pending() -> int:
+    """Run the due jobs, return the number of jobs run"""
+    jobs = get_queue().pop_due()
+    run_jobs(jobs)
+    return len(jobs)
+
+
+def _enqueue_jobs(jobs: List[Job]):
+    def _push():
+        if settings.PROVISIONING_EAGER:
+            run_jobs(jobs)
+            return
+        due_at = time.time() + settings.PROVISIONING_COALESCE_SECONDS
+        for kind, key in jobs:
+            get_queue().push(kind, key, due_at)
+
+    transaction.on_commit(_push)
+
+
+def enqueue(kind: str, key: Optional[object] = None):
+    """Enqueue a job once the current transaction is committed
+
+    With `PROVISIONING_EAGER` the job is run right after the commit instead,
+    which is handy when no worker is running.
+    """
+    job = (kind, str(key if key is not None else "all"))
+    pending = getattr(_batch, "jobs", None)
+    if pending is not None:
+        pending.setdefault(job, None)
+        return
+    _enqueue_jobs([job])
+
+
+def batch_memo() -> Optional[Dict[Any, Any]]:
+    """Dict shared by the whole current `batch()` block, None outside of one
+
+    The receivers keep there what every save of a bulk write would otherwise query again.
+    """
+    return getattr(_batch, "memo", None)
+
+
+@contextmanager
+def batch() -> Iterator[None]:
+    """Collect the jobs enqueued in the block and enqueue each distinct job once when it exits
+
+    Meant for the bulk writes: thousands of saves end up in a single provisioning pass.
+    Nothing is enqueued if the block raises. Nested blocks join the outermost one.
+    """
+    if getattr(_batch, "jobs", None) is not None:
+        yield
+        return
+
+    _batch.jobs = {}
+    _batch.memo = {}
+    try:
+        yield
+        jobs = list(_batch.jobs)
+    finally:
+        _batch.jobs = None
+        _batch.memo = None
+    if jobs:
+        _enqueue_jobs(jobs)
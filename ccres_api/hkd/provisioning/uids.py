@@ -0,0 +1,47 @@
+"""
+Name -> UID indexes of the Grafana datasources and folders
+
+The indexes are kept in the Django cache (Redis in production) for
+`GRAFANA_UID_CACHE_TTL` seconds, so resolving a UID is a dictionary lookup
+instead of a listing fetched from Grafana on every sync.
+"""
+from typing import Dict, Optional, Type
+
+from config.settings.base import GRAFANA_API_URL, GRAFANA_UID_CACHE_TTL
+from django.core.cache import cache
+from hkd.sessions import get_grafana_session
+from services.grafana_api.datasources_manager import DatasourceManager
+from services.grafana_api.folder_manager import FolderManager
+
+DATASOURCE_UIDS_KEY = "hkd:grafana:datasource-uids"
+FOLDER_UIDS_KEY = "hkd:grafana:folder-uids"
+
+
+def _fetch_index(manager_class: Type, name_field: str) -> Dict[str, str]:
+    manager = manager_class(GRAFANA_API_URL, get_grafana_session())
+    return {
+        item[name_field]: item.get("uid")
+        for item in manager.get_fetched_json()
+        if item.get(name_field) is not None
+    }
+
+
+def _get_uid(key: str, name: str, manager_class: Type, name_field: str) -> Optional[str]:
+    index = cache.get(key)
+    # An unknown name may have been created since the index was cached, refetch once
+    if index is None or name not in index:
+        index = _fetch_index(manager_class, name_field)
+        cache.set(key, index, GRAFANA_UID_CACHE_TTL)
+    return index.get(name)
+
+
+def get_datasource_uid(name: str) -> Optional[str]:
+    return _get_uid(DATASOURCE_UIDS_KEY, name, DatasourceManager, "name")
+
+
+def get_folder_uid(title: str) -> Optional[str]:
+    return _get_uid(FOLDER_UIDS_KEY, title, FolderManager, "title")
+
+
+def invalidate_folder_uids():
+    cache.delete(FOLDER_UIDS_KEY)
@@ -1,9 +1,14 @@
+from typing import List, Optional
+
+from django.core.exceptions import ValidationError as DjangoValidationError
 from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
 from .models import (
     Station,
     Influx,
     InfluxSource,
     Instrument,
+    InstrumentModel,
     Grafana,
     GrafanaDashboard,
     GrafanaPanel,
@@ -17,85 +22,208 @@ from .models import (
 )
 
 
-class StationSerializer(serializers.ModelSerializer):
+def get_requested_fields(request) -> Optional[List[str]]:
+    """Field names asked with the `?fields=id,name` query parameter, None when not given"""
+    if request is None:
+        return None
+    fields = request.query_params.get("fields")
+    if not fields:
+        return None
+    return [field.strip() for field in fields.split(",") if field.strip()]
+
+
+class SparseFieldsMixin:
+    """Only serialize the fields asked with `?fields=`
+
+    Reads only: a write validates and returns all the fields, the projection would drop the input.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get("request")
+        if request is None or request.method not in SAFE_METHODS:
+            return
+        requested = get_requested_fields(request)
+        if requested is None:
+            return
+        for field_name in set(self.fields) - set(requested):
+            self.fields.pop(field_name)
+
+
+class PrefetchedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """Primary key field reading the objects prefetched in `context["related_objects"]`
+
+    The bulk routes fetch the targets of every row at once, `{model: {pk: object}}`, instead of a
+    query per row. Without them the field queries the database as usual.
+    """
+
+    def to_internal_value(self, data):
+        queryset = self.get_queryset()
+        objects = self.context.get("related_objects", {}).get(queryset.model)
+        if objects is None:
+            return super().to_internal_value(data)
+        if isinstance(data, bool):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+        try:
+            pk = queryset.model._meta.pk.to_python(data)
+        except DjangoValidationError:
+            self.fail("incorrect_type", data_type=type(data).__name__)
+        if pk not in objects:
+            self.fail("does_not_exist", pk_value=data)
+        return objects[pk]
+
+
+class BulkRelationsMixin:
+    """Resolve the relations with `PrefetchedPrimaryKeyRelatedField`"""
+
+    serializer_related_field = PrefetchedPrimaryKeyRelatedField
+
+
+class StationSerializer(BulkRelationsMixin, SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Station
         fields = "__all__"
 
 
-class InstrumentSerializer(serializers.ModelSerializer):
+class InstrumentSerializer(BulkRelationsMixin, SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Instrument
         fields = "__all__"
 
 
-class GrafanaSerializer(serializers.ModelSerializer):
+class GrafanaSerializer(BulkRelationsMixin, SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Grafana
         fields = "__all__"
 
 
-class GrafanaPanelSerializer(serializers.ModelSerializer):
+class GrafanaPanelSerializer(BulkRelationsMixin, SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = GrafanaPanel
         fields = "__all__"
 
 
-class GrafanaDashboardSerializer(serializers.ModelSerializer):
+class GrafanaPanelSummarySerializer(BulkRelationsMixin, SparseFieldsMixin, serializers.ModelSerializer):
+    """Panel without its JSON content, used by the lists"""
+
+    class Meta:
+        model = GrafanaPanel
+        fields = ("id", "name", "dashboard")
+
+
+class GrafanaDashboardSerializer(BulkRelationsMixin, SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = GrafanaDashboard
         fields = "__all__"
 
 
-class InfluxSerializer(serializers.ModelSerializer):
+class GrafanaDashboardSummarySerializer(BulkRelationsMixin, SparseFieldsMixin, serializers.ModelSerializer):
+    """Dashboard without its JSON content, used by the lists"""
+
+    class Meta:
+        model = GrafanaDashboard
+        fields = ("id", "name", "source", "grafana")
+
+
+class InfluxSerializer(BulkRelationsMixin, SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Influx
         fields = "__all__"
 
 
-class InfluxSourceSerializer(serializers.ModelSerializer):
+class InfluxSourceSerializer(BulkRelationsMixin, SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = InfluxSource
         fields = "__all__"
 
 
-class ParameterSerializer(serializers.ModelSerializer):
+class ParameterSerializer(BulkRelationsMixin, SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Parameter
         fields = "__all__"
 
 
-class FirmwareSerializer(serializers.ModelSerializer):
+class FirmwareSerializer(BulkRelationsMixin, SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Firmware
         fields = "__all__"
 
 
-class PreprocessingSerializer(serializers.ModelSerializer):
+class PreprocessingSerializer(BulkRelationsMixin, SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Preprocessing
         fields = "__all__"
 
 
-class AlertContactGroupSerializer(serializers.ModelSerializer):
+class AlertContactGroupSerializer(BulkRelationsMixin, SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = AlertContactGroup
         fields = "__all__"
 
 
-class AlertContactSerializer(serializers.ModelSerializer):
+class AlertContactSerializer(BulkRelationsMixin, SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = AlertContact
         fields = "__all__"
 
 
-class AlertSerializer(serializers.ModelSerializer):
+class AlertSerializer(BulkRelationsMixin, SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Alert
         fields = "__all__"
 
 
-class AlertDependencySerializer(serializers.ModelSerializer):
+class AlertDependencySerializer(BulkRelationsMixin, SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = AlertDependency
         fields = "__all__"
+
+
+class PreprocessingTreeSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Preprocessing
+        exclude = ("parameter",)
+
+
+class AlertTreeSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Alert
+        exclude = ("parameter",)
+
+
+class ParameterTreeSerializer(serializers.ModelSerializer):
+    preprocessings = PreprocessingTreeSerializer(source="preprocessing_set", many=True)
+    alerts = AlertTreeSerializer(source="alert_set", many=True)
+
+    class Meta:
+        model = Parameter
+        exclude = ("instrument_model",)
+
+
+class InstrumentModelTreeSerializer(serializers.ModelSerializer):
+    parameters = ParameterTreeSerializer(source="parameter_set", many=True)
+
+    class Meta:
+        model = InstrumentModel
+        fields = "__all__"
+
+
+class InstrumentTreeSerializer(serializers.ModelSerializer):
+    instrument_model = InstrumentModelTreeSerializer()
+
+    class Meta:
+        model = Instrument
+        exclude = ("station",)
+
+
+class StationTreeSerializer(serializers.ModelSerializer):
+    """Station with its instruments, their model, parameters, preprocessings and alerts nested
+
+    Read only, the relations are expected to be prefetched (see `StationViewSet.tree`).
+    """
+
+    instruments = InstrumentTreeSerializer(source="instrument_set", many=True)
+
+    class Meta:
+        model = Station
+        fields = "__all__"
@@ -2,13 +2,41 @@ from config.settings.base import (
     GRAFANA_AUTH_PASSWORD,
     GRAFANA_AUTH_TOKEN,
     GRAFANA_AUTH_USERNAME,
+    GRAFANA_BACKOFF_FACTOR,
+    GRAFANA_MAX_RETRIES,
+    GRAFANA_MAX_WORKERS,
+    GRAFANA_POOL_SIZE,
+    GRAFANA_TIMEOUT,
 )
+from services.grafana_api.client import GrafanaClient
 import requests
 import logging
+import threading
 
+_session = None
+_session_lock = threading.Lock()
 
-def get_grafana_session():
-    session = requests.Session()
+
+def get_grafana_session() -> GrafanaClient:
+    """Grafana client shared by every sync of the process
+
+    It is built once, so its connection pool is reused from one sync to the other.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = _build_grafana_session()
+    return _session
+
+
+def _build_grafana_session() -> GrafanaClient:
+    session = GrafanaClient(
+        pool_maxsize=GRAFANA_POOL_SIZE,
+        max_retries=GRAFANA_MAX_RETRIES,
+        backoff_factor=GRAFANA_BACKOFF_FACTOR,
+        timeout=GRAFANA_TIMEOUT,
+        max_workers=GRAFANA_MAX_WORKERS,
+    )
     session.headers.update({"x-disable-provenance": "true"})
 
     is_auth = False
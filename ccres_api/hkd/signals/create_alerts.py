@@ -1,15 +1,18 @@
 """
 Signals that are run when a object is saved or updated in the db
 """
-from typing import Any, Dict, List, Optional, Type
+import re
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Set, Tuple
 
 from config.settings.base import (
     GRAFANA_ALERTS_FOLDER,
+    GRAFANA_ALERTS_GROUP_SIZE,
     GRAFANA_API_URL,
     INFLUX_DB_BUCKET,
     INFLUX_DB_DATASOURCE_NAME,
 )
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
 from grafanalib.core import (
     EXP_TYPE_CLASSIC,
@@ -25,20 +28,18 @@ from grafanalib.core import (
     Target,
     WithinRange,
 )
-from hkd.models import Alert, Instrument, Station
+from hkd.models import Alert, Instrument, InstrumentModel, Parameter, Station
 from hkd.models.helpers import DurationUnit, Operator
+from hkd.provisioning import batch, enqueue, register
+from hkd.provisioning.graph import get_affected_station_ids, get_previous_values, load_provisioning_graph
+from hkd.provisioning.uids import get_datasource_uid
 from hkd.sessions import get_grafana_session
 from services.grafana_api.addons.alert import AlertRulev9Fixed
 from services.grafana_api.alert_manager import AlertManager
-from services.grafana_api.datasources_manager import DatasourceManager
 from services.grafana_api.query import FluxQueryBuilder
 
-
-def _get_uid_of_datasource(datasource_name: str, folder_json: Dict[Any, Any]) -> Optional[str]:
-    for sub_json in folder_json:
-        title = sub_json.get("name")
-        if title is not None and title == datasource_name:
-            return sub_json.get("uid")
+# (alert pk, contact group pk) of a rule of a station
+RuleKey = Tuple[int, int]
 
 
 def create_conditions(instance: Alert) -> List[AlertCondition]:
@@ -91,7 +92,12 @@ def create_conditions(instance: Alert) -> List[AlertCondition]:
     return conditions
 
 
-def get_alert_group(datasource_uid, alert, parameter, instrument_model, station, contact_group):
+def get_alert_rule(datasource_uid, alert, parameter, instrument_model, station, contact_group) -> AlertRulev9Fixed:
+    """Rule of an alert at a station, notifying one contact group
+
+    Grafana identifies a rule of a folder by its title, so the title holds everything the rule
+    is keyed on: the station, the alert (with its model and parameter) and the contact group.
+    """
     flux_query = (
         FluxQueryBuilder(INFLUX_DB_BUCKET)
         .range(start="v.timeRangeStart", stop="v.timeRangeStop")
@@ -100,76 +106,169 @@ def get_alert_group(datasource_uid, alert, parameter, instrument_model, station,
         .filter(on="site", what=station.name)
         .build()
     )
-    evaluation_frequency_seconds = DurationUnit.to_seconds(
-        alert.evaluation_frequency_unit, alert.evaluation_frequency
-    )
     evaluation_duration_seconds = DurationUnit.to_seconds(
         alert.evaluation_duration_unit, alert.evaluation_duration
     )
     conditions = create_conditions(alert)
 
-    alertgroup = AlertGroup(
-        name=station.name,
-        evaluateInterval=f"{evaluation_frequency_seconds}s",
-        rules=[
-            AlertRulev9Fixed(
-                title=alert.title,
-                condition="B",
-                triggers=[
-                    Target(
-                        refId="A",
-                        datasource=datasource_uid,
-                        expr=flux_query,
-                    ),
-                    AlertExpression(
-                        refId="B",
-                        expressionType=EXP_TYPE_CLASSIC,
-                        expression="A",
-                        conditions=conditions,
-                    ),
-                ],
-                annotations={
-                    "summary": alert.message_summary,
-                    "description": alert.message_description,
-                },
-                labels={
-                    "team": contact_group.name,
-                },
-                evaluateFor=f"{evaluation_duration_seconds}s",
+    return AlertRulev9Fixed(
+        title=(
+            f"{station.name} - {instrument_model.model} - {parameter.name} - {alert.title}"
+            f" ({contact_group.name}) #{alert.pk}"
+        ),
+        condition="B",
+        triggers=[
+            Target(
+                refId="A",
+                datasource=datasource_uid,
+                expr=flux_query,
+            ),
+            AlertExpression(
+                refId="B",
+                expressionType=EXP_TYPE_CLASSIC,
+                expression="A",
+                conditions=conditions,
             ),
         ],
+        annotations={
+            "summary": alert.message_summary,
+            "description": alert.message_description,
+        },
+        labels={
+            "team": contact_group.name,
+            "station": station.name,
+        },
+        evaluateFor=f"{evaluation_duration_seconds}s",
     )
 
-    return alertgroup
 
+def get_evaluation_interval(alert: Alert) -> int:
+    return DurationUnit.to_seconds(alert.evaluation_frequency_unit, alert.evaluation_frequency)
 
-@receiver(post_save, sender=Alert)
-@receiver(post_delete, sender=Alert)
-def create_grafana_alert(sender: Type[Alert], instance: Alert, **kwargs):
+
+def partition_alert_rules(station: Station, rules: Dict[RuleKey, Tuple[Alert, AlertRulev9Fixed]]) -> List[AlertGroup]:
+    """Split the rules of a station into groups of one evaluation interval and at most
+    `GRAFANA_ALERTS_GROUP_SIZE` alerts
+
+    Grafana evaluates the rules of a group together, at the interval of the group: small groups
+    spread the evaluations. An alert always lands in the same bucket of its interval, from its
+    pk, so adding, changing or deleting an alert only touches its own group, never shifts the
+    rules of the other groups.
+    """
+    rules_by_bucket: Dict[Tuple[int, int], List[AlertRulev9Fixed]] = defaultdict(list)
+    for _, (alert, rule) in sorted(rules.items()):
+        bucket = (get_evaluation_interval(alert), alert.pk // GRAFANA_ALERTS_GROUP_SIZE)
+        rules_by_bucket[bucket].append(rule)
+
+    return [
+        AlertGroup(
+            name=f"{station.name} - {interval}s - {bucket + 1}",
+            evaluateInterval=f"{interval}s",
+            rules=bucket_rules,
+        )
+        for (interval, bucket), bucket_rules in sorted(rules_by_bucket.items())
+    ]
+
+
+# Name of the groups made by `partition_alert_rules`: "<station> - <interval>s - <n>"
+ALERT_GROUP_NAME = re.compile(r"^.+ - \d+s - \d+$")
+
+
+def get_group_station(alert_group: Dict[str, Any]) -> Optional[str]:
+    """Station of a rule group pushed by `sync_alert_groups`, from the labels of its rules"""
+    for rule in alert_group.get("rules", []):
+        station = (rule.get("labels") or {}).get("station")
+        if station is not None:
+            return station
+    return None
+
+
+@register("alert_groups")
+def sync_alert_groups(station_ids: List[str]):
+    """Rebuild and push the rule groups of each station, leaving the other stations untouched
+
+    Only the groups that changed are pushed, then the groups of the station that are not
+    produced any more (e.g. all the alerts of an interval were deleted) are deleted, as well as
+    the groups of the stations that no longer exist (deleted or renamed) and the groups of the
+    folder left by the previous layouts (unlabelled or named otherwise).
+    """
+    stations = load_provisioning_graph(station_ids)
     session = get_grafana_session()
     alert_rule_manager = AlertManager(GRAFANA_API_URL, session)
-    datasource_manager = DatasourceManager(GRAFANA_API_URL, session)
-    datasource_uid = _get_uid_of_datasource(
-        INFLUX_DB_DATASOURCE_NAME, datasource_manager.get_fetched_json()
-    )
-    alerts = Alert.objects.all()
-
-    # If no alerts remove all the folders
-    if len(alerts) == 0:
-        alert_rule_manager.delete_folder(GRAFANA_ALERTS_FOLDER)
-
-    for alert in alerts:
-        parameter = alert.parameter
-        instrument_model = parameter.instrument_model
-
-        stations = Station.objects.filter(instrument__instrument_model=instrument_model)
-
-        for station in stations:
-            instruments = Instrument.objects.filter(instrument_model=instrument_model)
-            for instrument in instruments:
-                contact_group = instrument.contact_group
-                alertgroup = get_alert_group(
-                    datasource_uid, alert, parameter, instrument_model, station, contact_group
-                )
-                alert_rule_manager.add_alert(alertgroup, folder=GRAFANA_ALERTS_FOLDER)
-    alert_rule_manager.push(delete_existing=True)
+    existing_groups = alert_rule_manager.fetch_namespace(GRAFANA_ALERTS_FOLDER)
+    station_names = set(Station.objects.values_list("name", flat=True))
+
+    stale_groups: Set[str] = {
+        name
+        for name, alert_group in existing_groups.items()
+        if get_group_station(alert_group) not in station_names or not ALERT_GROUP_NAME.match(name)
+    }
+    datasource_uid = get_datasource_uid(INFLUX_DB_DATASOURCE_NAME) if stations else None
+    for station in stations:
+        # One rule per (alert, contact group) of the station: the instruments of a model share the
+        # query, those notifying another contact group need their own `team` label
+        rules: Dict[RuleKey, Tuple[Alert, AlertRulev9Fixed]] = {}
+        for instrument in station.instrument_set.all():
+            instrument_model = instrument.instrument_model
+            for parameter in instrument_model.parameter_set.all():
+                for alert in parameter.alert_set.all():
+                    rule_key = (alert.pk, instrument.contact_group_id)
+                    if rule_key in rules:
+                        continue
+                    rules[rule_key] = (
+                        alert,
+                        get_alert_rule(
+                            datasource_uid,
+                            alert,
+                            parameter,
+                            instrument_model,
+                            station,
+                            instrument.contact_group,
+                        ),
+                    )
+
+        alertgroups = partition_alert_rules(station, rules)
+        names = {alertgroup.name for alertgroup in alertgroups}
+        stale_groups.update(
+            name
+            for name, alert_group in existing_groups.items()
+            if name not in names and get_group_station(alert_group) == station.name
+        )
+        for alertgroup in alertgroups:
+            alert_rule_manager.add_alert(alertgroup, folder=GRAFANA_ALERTS_FOLDER)
+
+    alert_rule_manager.upsert_groups()
+    # Deleted last: the rules moved to another group were already pushed with their uid
+    for name in sorted(stale_groups):
+        alert_rule_manager.delete_alert_group(name, folder=GRAFANA_ALERTS_FOLDER)
+
+
+@receiver(pre_save, sender=Alert)
+@receiver(pre_save, sender=Instrument)
+@receiver(pre_save, sender=Parameter)
+def remember_previous_values(sender: Any, instance: Any, raw: bool = False, **kwargs):
+    """Keep the station, model or parameter an instance is moved from, its rules must go"""
+    if raw:
+        return None
+    instance._provisioning_previous = get_previous_values(sender, instance)
+
+
+@receiver(post_save, sender=Alert)
+@receiver(post_delete, sender=Alert)
+@receiver(post_save, sender=Station)
+@receiver(post_delete, sender=Station)
+@receiver(post_save, sender=Instrument)
+@receiver(post_delete, sender=Instrument)
+@receiver(post_save, sender=InstrumentModel)
+@receiver(post_delete, sender=InstrumentModel)
+@receiver(post_save, sender=Parameter)
+@receiver(post_delete, sender=Parameter)
+def create_grafana_alert(sender: Any, instance: Any, created: bool = False, **kwargs):
+    # A new station, instrument model or parameter has no alert yet
+    if created and sender in (Station, InstrumentModel, Parameter):
+        return None
+
+    previous = getattr(instance, "_provisioning_previous", None)
+    with batch():
+        for station_id in get_affected_station_ids(sender, instance, previous):
+            enqueue("alert_groups", station_id)
@@ -1,37 +1,50 @@
 """
 Signals that are run when a object is saved or updated in the db
 """
-from typing import Any, Dict, List, Optional, Type
+from typing import Any, List, Type
 
 from config.settings.base import GRAFANA_API_URL
+from django.db.models import Prefetch
 from django.db.models.signals import m2m_changed
 from django.dispatch import receiver
 from hkd.models import AlertContact, AlertContactGroup
+from hkd.provisioning import batch, enqueue, register
 from hkd.sessions import get_grafana_session
 from services.grafana_api.addons.contact import ContactPointEmail, ContactPointEmailSettings
 from services.grafana_api.notification_manager import NotificationManager
 
 
-@receiver(m2m_changed, sender=AlertContact.groups.through)
-def create_grafana_contact(sender: Type[AlertContact], instance: AlertContact, **kwargs):
-    action = kwargs.pop("action", None)
-    if action and action != "post_add":
-        return None
+@register("contact_groups")
+def sync_contact_groups(group_ids: List[str]):
+    """Push the contact points of the groups in one alertmanager configuration update"""
+    groups = AlertContactGroup.objects.filter(pk__in=group_ids).prefetch_related(
+        Prefetch("alertcontact_set", queryset=AlertContact.objects.only("email").order_by("pk"))
+    )
+    if not groups:
+        return
 
-    session = get_grafana_session()
-    groups = instance.groups.all()
+    notification_manager = NotificationManager(GRAFANA_API_URL, get_grafana_session())
     for group in groups:
-        contacts = AlertContact.objects.filter(
-            groups=group.id,
-        )
-
-        emails = [contact.email for contact in contacts]
-
         contact_point = ContactPointEmail(
             name=group.name,
-            settings=ContactPointEmailSettings(addresses=emails),
+            settings=ContactPointEmailSettings(addresses=[contact.email for contact in group.alertcontact_set.all()]),
         )
-
-        notification_manager = NotificationManager(GRAFANA_API_URL, session)
         notification_manager.add_contact_point(contact_point)
-        notification_manager.push()
+    notification_manager.push()
+
+
+@receiver(m2m_changed, sender=AlertContact.groups.through)
+def create_grafana_contact(sender: Type[AlertContact], instance: Any, **kwargs):
+    action = kwargs.pop("action", None)
+    if action and action != "post_add":
+        return None
+
+    # `group.alertcontact_set.add(...)` sends the signal with the group as instance
+    if kwargs.get("reverse"):
+        group_ids = [instance.pk]
+    else:
+        group_ids = kwargs.get("pk_set") or []
+
+    with batch():
+        for group_id in group_ids:
+            enqueue("contact_groups", group_id)
@@ -1,32 +1,33 @@
 """
 Signals that are run when a object is saved or updated in the db
 """
-from typing import Any, Dict, Optional
+from typing import Any, List, Optional
 
 from config.settings.base import GRAFANA_API_URL, INFLUX_DB_BUCKET, INFLUX_DB_DATASOURCE_NAME
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 from grafanalib.core import Dashboard, GridPos, Target, TimeSeries
 from hkd.models import Instrument, InstrumentModel, Parameter, Station
+from hkd.provisioning import batch, enqueue, register
+from hkd.provisioning.graph import get_affected_station_ids, get_instrument_models, load_provisioning_graph
+from hkd.provisioning.hashes import CacheHashStore
+from hkd.provisioning.uids import get_folder_uid, invalidate_folder_uids
 from hkd.sessions import get_grafana_session
 from services.grafana_api.addons.folder import Folder
+from services.grafana_api.base import AcceptableCodes
 from services.grafana_api.dashboard_manager import DashboardManager
 from services.grafana_api.folder_manager import FolderManager
 from services.grafana_api.query import FluxQueryBuilder
 
 
-def _get_uid_of_station(station_name: str, folder_json: Dict[Any, Any]) -> Optional[str]:
-    for sub_json in folder_json:
-        title = sub_json.get("title")
-        if title is not None and title == station_name:
-            return sub_json.get("uid")
-
-
 def create_folders(folder_manager, stations):
     for station in stations:
         folder = Folder(station.name)
         folder_manager.add_folder(folder)
-    folder_manager.push()
+    responses = folder_manager.push()
+    # 409/412 mean the folder already existed
+    if any(res.status_code == AcceptableCodes.OK.value for res in responses):
+        invalidate_folder_uids()
 
 
 def build_panels(station, instrument_model, parameters):
@@ -58,13 +59,12 @@ def build_panels(station, instrument_model, parameters):
     return panels
 
 
-def add_dashboards(dashboard_manager, folder_json, stations):
+def add_dashboards(dashboard_manager, stations):
     for station in stations:
-        station_uid = _get_uid_of_station(station.name, folder_json)
+        station_uid = get_folder_uid(station.name)
 
-        instrument_models = InstrumentModel.objects.filter(instrument__station=station)
-        for instrument_model in instrument_models:
-            parameters = Parameter.objects.filter(instrument_model=instrument_model)
+        for instrument_model in get_instrument_models(station):
+            parameters = instrument_model.parameter_set.all()
             panels = build_panels(station, instrument_model, parameters)
 
             dashboard = Dashboard(
@@ -79,22 +79,36 @@ def add_dashboards(dashboard_manager, folder_json, stations):
     dashboard_manager.push()
 
 
-@receiver(post_save, sender=Station)
-@receiver(post_save, sender=Instrument)
-@receiver(post_save, sender=InstrumentModel)
-@receiver(post_save, sender=Parameter)
-def create_grafana_dashboards(sender: Any, instance: Any, created, **kwargs):
-    if not created:
+@register("dashboards")
+def sync_dashboards(station_ids: List[str]):
+    """Create the folders and push the dashboards of the given stations
+
+    The "all" key syncs the whole fleet.
+    """
+    scope: Optional[List[str]] = None if "all" in station_ids else station_ids
+    stations = load_provisioning_graph(scope)
+    if not stations:
         return None
 
     session = get_grafana_session()
-    dashboard_manager = DashboardManager(GRAFANA_API_URL, session)
+    dashboard_manager = DashboardManager(
+        GRAFANA_API_URL, session, hash_store=CacheHashStore("hkd:grafana:dashboard-hash")
+    )
     folder_manager = FolderManager(GRAFANA_API_URL, session)
 
-    stations = Station.objects.all()
-
     create_folders(folder_manager, stations)
 
-    folder_json = folder_manager.fetch()
+    add_dashboards(dashboard_manager, stations)
+
+
+@receiver(post_save, sender=Station)
+@receiver(post_save, sender=Instrument)
+@receiver(post_save, sender=InstrumentModel)
+@receiver(post_save, sender=Parameter)
+def create_grafana_dashboards(sender: Any, instance: Any, created, **kwargs):
+    if not created:
+        return None
 
-    add_dashboards(dashboard_manager, folder_json, stations)
+    with batch():
+        for station_id in get_affected_station_ids(sender, instance):
+            enqueue("dashboards", station_id)
@@ -0,0 +1,42 @@
+"""
+Signals bumping the version of the cached hkd catalogues (see `hkd.caching`)
+"""
+from functools import partial
+from typing import Any, Type
+
+from django.db import transaction
+from django.db.models import Model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from hkd.caching import bump_model_version
+from hkd.models import (
+    Alert,
+    Firmware,
+    Instrument,
+    InstrumentCategory,
+    InstrumentModel,
+    Parameter,
+    Preprocessing,
+    Station,
+)
+
+
+@receiver(post_save, sender=Station)
+@receiver(post_save, sender=Instrument)
+@receiver(post_save, sender=InstrumentModel)
+@receiver(post_save, sender=InstrumentCategory)
+@receiver(post_save, sender=Parameter)
+@receiver(post_save, sender=Preprocessing)
+@receiver(post_save, sender=Alert)
+@receiver(post_save, sender=Firmware)
+@receiver(post_delete, sender=Station)
+@receiver(post_delete, sender=Instrument)
+@receiver(post_delete, sender=InstrumentModel)
+@receiver(post_delete, sender=InstrumentCategory)
+@receiver(post_delete, sender=Parameter)
+@receiver(post_delete, sender=Preprocessing)
+@receiver(post_delete, sender=Alert)
+@receiver(post_delete, sender=Firmware)
+def invalidate_cached_reads(sender: Type[Model], instance: Any, **kwargs):
+    # Bumped before the commit, a concurrent read would cache the old rows under the new version
+    transaction.on_commit(partial(bump_model_version, sender))
@@ -1,3 +1,611 @@
-from django.test import TestCase
+"""
+Query-count and latency budgets of the hkd API and of the Grafana provisioning
 
-# Create your tests here.
+The tests seed a realistic fleet and fail when an endpoint or a signal goes over its budget
+of SQL queries, wall-clock time or Grafana calls. Grafana is replaced by `FakeGrafanaServer`.
+"""
+import datetime as dt
+import time
+from contextlib import contextmanager
+from typing import Iterator, List
+from unittest import mock
+
+from config.settings.base import GRAFANA_ALERTS_FOLDER, GRAFANA_ALERTS_GROUP_SIZE
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import http_date
+from rest_framework.test import APIClient
+
+from hkd.models import (
+    Alert,
+    AlertContact,
+    AlertContactGroup,
+    Firmware,
+    Instrument,
+    InstrumentCategory,
+    InstrumentModel,
+    Parameter,
+    Preprocessing,
+    Station,
+)
+from hkd.sessions import get_grafana_session
+from hkd.signals.create_alerts import get_group_station, sync_alert_groups
+from hkd.signals.create_contact import sync_contact_groups
+from hkd.signals.create_dashboards import sync_dashboards
+from services.grafana_api.fake_server import RULER_PREFIX, FakeGrafanaServer
+from services.grafana_api.notification_manager import NotificationManager
+
+N_STATIONS = 20
+N_INSTRUMENT_MODELS = 20
+INSTRUMENTS_PER_STATION = 10
+PARAMETERS_PER_MODEL = 50
+N_CONTACTS = 50
+
+# Budgets, the time ones are loose enough for a slow CI runner
+LIST_MAX_QUERIES = 4
+LIST_MAX_SECONDS = 1.0
+TREE_MAX_QUERIES = 8
+SYNC_MAX_SECONDS = 10.0
+
+LIST_URLS = [
+    "/api/v1/station/",
+    "/api/v1/instrument/",
+    "/api/v1/grafana/",
+    "/api/v1/grafanapanel/",
+    "/api/v1/grafanadashboard/",
+    "/api/v1/influx/",
+    "/api/v1/influxsource/",
+    "/api/v1/parameter/",
+    "/api/v1/firmware/",
+    "/api/v1/preprocessing/",
+    "/api/v1/alertcontact/",
+    "/api/v1/alert/",
+    "/api/v1/alertdependency/",
+]
+
+GRAFANA_URL_SETTINGS = [
+    "hkd.signals.create_alerts.GRAFANA_API_URL",
+    "hkd.signals.create_contact.GRAFANA_API_URL",
+    "hkd.signals.create_dashboards.GRAFANA_API_URL",
+    "hkd.provisioning.uids.GRAFANA_API_URL",
+]
+
+
+def seed_fleet():
+    """Stations each running instruments of several models, every parameter having an alert"""
+    user = get_user_model().objects.create(username="pi")
+    contact_group = AlertContactGroup.objects.create(name="team")
+    category = InstrumentCategory.objects.create(name="lidar")
+    instrument_models = InstrumentModel.objects.bulk_create(
+        InstrumentModel(model=f"MODEL{i}", description="", manufacturer="", principal_investigator=user)
+        for i in range(N_INSTRUMENT_MODELS)
+    )
+    stations = Station.objects.bulk_create(
+        Station(name=f"STATION{i}", latitude=0, longitude=0, altitude=0) for i in range(N_STATIONS)
+    )
+    now = timezone.now()
+    Instrument.objects.bulk_create(
+        Instrument(
+            pid=f"https://hdl.handle.net/{i}-{k}",
+            date_start=now,
+            date_end=now + dt.timedelta(days=365),
+            is_active=True,
+            instrument_model=instrument_models[(i + k) % N_INSTRUMENT_MODELS],
+            station=station,
+            category=category,
+            contact_group=contact_group,
+        )
+        for i, station in enumerate(stations)
+        for k in range(INSTRUMENTS_PER_STATION)
+    )
+    parameters = Parameter.objects.bulk_create(
+        Parameter(name=f"param{j}", unit="K", instrument_model=instrument_model)
+        for instrument_model in instrument_models
+        for j in range(PARAMETERS_PER_MODEL)
+    )
+    Alert.objects.bulk_create(
+        Alert(
+            title=f"{parameter.name} too high",
+            parameter=parameter,
+            message_summary="too high",
+            message_description="too high",
+            trigger_maximum=100,
+            trigger_maximum_condition="gt",
+        )
+        for parameter in parameters
+    )
+    Preprocessing.objects.bulk_create(
+        Preprocessing(description="calibration", reference="ref", required=True, parameter=parameter)
+        for parameter in parameters
+    )
+    Firmware.objects.bulk_create(
+        Firmware(version="1.0", instrument_model=instrument_model) for instrument_model in instrument_models
+    )
+    contacts = AlertContact.objects.bulk_create(
+        AlertContact(name=f"contact{i}", email=f"contact{i}@example.org") for i in range(N_CONTACTS)
+    )
+    AlertContact.groups.through.objects.bulk_create(
+        AlertContact.groups.through(alertcontact=contact, alertcontactgroup=contact_group) for contact in contacts
+    )
+    return user
+
+
+class BudgetMixin:
+    @contextmanager
+    def assertBudget(self, max_queries: int, max_seconds: float) -> Iterator[CaptureQueriesContext]:
+        start = time.perf_counter()
+        with CaptureQueriesContext(connection) as queries:
+            yield queries
+        elapsed = time.perf_counter() - start
+        self.assertLessEqual(
+            len(queries),
+            max_queries,
+            "\n".join(query["sql"][:200] for query in queries.captured_queries),
+        )
+        self.assertLessEqual(elapsed, max_seconds)
+
+
+class ApiBudgetTests(BudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = seed_fleet()
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_list_endpoints(self):
+        for url in LIST_URLS:
+            with self.subTest(url=url), self.assertBudget(LIST_MAX_QUERIES, LIST_MAX_SECONDS):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+
+    def test_deep_page_costs_the_same_as_the_first(self):
+        response = self.client.get("/api/v1/parameter/", {"page_size": 10})
+        for _ in range(5):
+            response = self.client.get(response.json()["next"])
+        with self.assertBudget(LIST_MAX_QUERIES, LIST_MAX_SECONDS):
+            response = self.client.get(response.json()["next"])
+        self.assertEqual(len(response.json()["results"]), 10)
+
+    def test_retrieve_endpoints(self):
+        parameter = Parameter.objects.first()
+        for url in [f"/api/v1/parameter/{parameter.pk}/", f"/api/v1/station/{Station.objects.first().pk}/"]:
+            with self.subTest(url=url), self.assertBudget(LIST_MAX_QUERIES, LIST_MAX_SECONDS):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_filtered_list(self):
+        instrument_model = InstrumentModel.objects.first()
+        with self.assertBudget(LIST_MAX_QUERIES, LIST_MAX_SECONDS):
+            response = self.client.get("/api/v1/parameter/", {"instrument_model": instrument_model.pk})
+        self.assertEqual(len(response.json()["results"]), PARAMETERS_PER_MODEL)
+
+    def test_sparse_fields_only_apply_to_reads(self):
+        response = self.client.get("/api/v1/parameter/", {"fields": "id,name"})
+        self.assertEqual(set(response.json()["results"][0]), {"id", "name"})
+
+        parameter = Parameter.objects.first()
+        url = f"/api/v1/parameter/{parameter.pk}/?fields=id"
+        response = self.client.patch(url, {"name": "renamed"}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["name"], "renamed")
+        parameter.refresh_from_db()
+        self.assertEqual(parameter.name, "renamed")
+
+    def test_station_tree(self):
+        station = Station.objects.first()
+        with self.assertBudget(TREE_MAX_QUERIES, LIST_MAX_SECONDS):
+            response = self.client.get(f"/api/v1/station/{station.pk}/tree/")
+        instruments = response.json()["instruments"]
+        self.assertEqual(len(instruments), INSTRUMENTS_PER_STATION)
+        self.assertEqual(len(instruments[0]["instrument_model"]["parameters"]), PARAMETERS_PER_MODEL)
+
+    def test_not_modified_does_not_query_the_catalogue(self):
+        response = self.client.get("/api/v1/station/")
+        with self.assertBudget(LIST_MAX_QUERIES, LIST_MAX_SECONDS) as queries:
+            response = self.client.get("/api/v1/station/", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse([query for query in queries.captured_queries if "SELECT" in query["sql"]])
+
+    def test_catalogue_version_is_bumped_on_commit(self):
+        response = self.client.get("/api/v1/station/")
+        with self.captureOnCommitCallbacks(execute=True):
+            Station.objects.first().save()
+            # Not committed yet, the cached response is still valid
+            response = self.client.get("/api/v1/station/", HTTP_IF_NONE_MATCH=response["ETag"])
+            self.assertEqual(response.status_code, 304)
+        response = self.client.get("/api/v1/station/", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 200)
+
+    def test_last_modified_is_rounded_up(self):
+        with mock.patch("hkd.caching.time.time", return_value=1000.5):
+            response = self.client.get("/api/v1/station/")
+        self.assertEqual(response["Last-Modified"], http_date(1001))
+        response = self.client.get("/api/v1/station/", HTTP_IF_MODIFIED_SINCE=http_date(1000))
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get("/api/v1/station/", HTTP_IF_MODIFIED_SINCE=http_date(1001))
+        self.assertEqual(response.status_code, 304)
+
+    def test_bulk_create(self):
+        instrument_model = InstrumentModel.objects.first()
+        rows = [{"name": f"new{i}", "unit": "K", "instrument_model": instrument_model.pk} for i in range(500)]
+        # The foreign keys are fetched once and the signals share their station lookups
+        with self.assertBudget(10, 5.0):
+            response = self.client.post("/api/v1/parameter/bulk/", rows, format="json")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.json()), len(rows))
+
+    def test_bulk_rejects_invalid_ids(self):
+        parameter = Parameter.objects.first()
+        for method, data in [
+            (self.client.patch, [{"id": "abc", "unit": "K"}]),
+            (self.client.delete, [parameter.pk, "abc"]),
+            (self.client.post, [{"name": "new", "unit": "K", "instrument_model": "abc"}]),
+        ]:
+            with self.subTest(method=method.__name__):
+                response = method("/api/v1/parameter/bulk/", data, format="json")
+                self.assertEqual(response.status_code, 400)
+        self.assertTrue(Parameter.objects.filter(pk=parameter.pk).exists())
+
+
+@override_settings(PROVISIONING_EAGER=True)
+class ProvisioningBudgetTests(BudgetMixin, TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.grafana = FakeGrafanaServer().start()
+        cls.patches = [mock.patch(target, cls.grafana.url) for target in GRAFANA_URL_SETTINGS]
+        for patch in cls.patches:
+            patch.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        for patch in cls.patches:
+            patch.stop()
+        cls.grafana.stop()
+        super().tearDownClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = seed_fleet()
+
+    def setUp(self):
+        cache.clear()
+        self.grafana.clear()
+
+    def test_full_sync(self):
+        with self.assertBudget(10, SYNC_MAX_SECONDS):
+            sync_dashboards(["all"])
+        self.assertEqual(self.grafana.count("POST", "/api/folders"), N_STATIONS)
+        self.assertEqual(
+            self.grafana.count("POST", "/api/dashboards/db/"), N_STATIONS * INSTRUMENTS_PER_STATION
+        )
+
+    def test_new_parameter_pushes_only_the_changed_dashboards(self):
+        sync_dashboards(["all"])
+        self.grafana.reset()
+
+        instrument_model = InstrumentModel.objects.first()
+        n_stations = Station.objects.filter(instrument__instrument_model=instrument_model).distinct().count()
+        with self.assertBudget(10, SYNC_MAX_SECONDS):
+            with self.captureOnCommitCallbacks(execute=True):
+                Parameter.objects.create(name="new", unit="K", instrument_model=instrument_model)
+
+        self.assertEqual(self.grafana.count("POST", "/api/dashboards/db/"), n_stations)
+        self.assertEqual(self.grafana.count("POST", "/api/folders"), n_stations)
+
+    def test_new_station_syncs_only_itself(self):
+        with self.assertBudget(10, SYNC_MAX_SECONDS):
+            with self.captureOnCommitCallbacks(execute=True):
+                Station.objects.create(name="NEW", latitude=0, longitude=0, altitude=0)
+
+        self.assertEqual(self.grafana.count("POST", "/api/folders"), 1)
+        self.assertEqual(self.grafana.count("POST", "/api/dashboards/db/"), 0)
+
+    def test_saved_alert_pushes_the_groups_of_the_affected_stations(self):
+        alert = Alert.objects.select_related("parameter").first()
+        n_stations = (
+            Station.objects.filter(instrument__instrument_model=alert.parameter.instrument_model_id)
+            .distinct()
+            .count()
+        )
+        with self.assertBudget(10, SYNC_MAX_SECONDS):
+            with self.captureOnCommitCallbacks(execute=True):
+                alert.message_summary = "changed"
+                alert.save()
+
+        groups = self.grafana.rules[GRAFANA_ALERTS_FOLDER]
+        self.assertEqual(self.grafana.count("POST", "/api/ruler/"), len(groups))
+        self.assertEqual(len({get_group_station(group) for group in groups}), n_stations)
+        self.assertEqual(self.grafana.count("POST", "/api/folders"), 1)
+        self.assertEqual(self.grafana.count("DELETE"), 0)
+
+    @staticmethod
+    def alert_ids(station: Station) -> List[int]:
+        return list(
+            Alert.objects.filter(parameter__instrument_model__instrument__station=station)
+            .distinct()
+            .values_list("pk", flat=True)
+        )
+
+    def test_full_alert_sync(self):
+        station_ids = [str(pk) for pk in Station.objects.values_list("pk", flat=True)]
+        with self.assertBudget(10, SYNC_MAX_SECONDS):
+            sync_alert_groups(station_ids)
+        # Every instrument of a station is of another model, each parameter has one alert
+        rules_per_station = INSTRUMENTS_PER_STATION * PARAMETERS_PER_MODEL
+        # One group per range of GRAFANA_ALERTS_GROUP_SIZE alert ids of each station
+        n_groups = sum(
+            len({pk // GRAFANA_ALERTS_GROUP_SIZE for pk in self.alert_ids(station)})
+            for station in Station.objects.all()
+        )
+        self.assertEqual(self.grafana.count("POST", "/api/ruler/"), n_groups)
+        groups = self.grafana.rules[GRAFANA_ALERTS_FOLDER]
+        self.assertLessEqual(max(len(group["rules"]) for group in groups), GRAFANA_ALERTS_GROUP_SIZE)
+        self.assertEqual(sum(len(group["rules"]) for group in groups), N_STATIONS * rules_per_station)
+
+    def test_alert_rules_are_keyed_by_alert_and_contact_group(self):
+        station = Station.objects.first()
+        instrument = station.instrument_set.select_related("instrument_model").first()
+        other_model = InstrumentModel.objects.exclude(instrument__station=station).first()
+        other_team = AlertContactGroup.objects.create(name="other team")
+        # Same title on another model of the station, and a second instrument notifying another team
+        Alert.objects.create(
+            title="Temperature too high", parameter=Parameter.objects.filter(instrument_model=other_model).first()
+        )
+        Alert.objects.create(
+            title="Temperature too high",
+            parameter=Parameter.objects.filter(instrument_model=instrument.instrument_model).first(),
+        )
+        for instrument_model in [instrument.instrument_model, other_model]:
+            Instrument.objects.create(
+                pid=f"https://hdl.handle.net/{instrument_model.model}",
+                date_start=instrument.date_start,
+                date_end=instrument.date_end,
+                is_active=True,
+                instrument_model=instrument_model,
+                station=station,
+                category=instrument.category,
+                contact_group=other_team,
+            )
+
+        sync_alert_groups([str(station.pk)])
+        rules = [
+            rule
+            for group in self.grafana.rules[GRAFANA_ALERTS_FOLDER]
+            for rule in group["rules"]
+            if "Temperature too high" in rule["grafana_alert"]["title"]
+        ]
+        self.assertEqual(
+            sorted((rule["labels"]["team"], other_model.model in rule["grafana_alert"]["title"]) for rule in rules),
+            [("other team", False), ("other team", True), ("team", False)],
+        )
+
+    def test_deleted_alert_only_touches_its_group(self):
+        station = Station.objects.first()
+        sync_alert_groups([str(station.pk)])
+        Alert.objects.filter(pk=min(self.alert_ids(station))).delete()
+        self.grafana.reset()
+        sync_alert_groups([str(station.pk)])
+        self.assertEqual(self.grafana.count("POST", "/api/ruler/"), 1)
+
+    def test_alert_groups_are_split_by_evaluation_interval(self):
+        station = Station.objects.first()
+        alert = Alert.objects.get(pk=min(self.alert_ids(station)))
+        group_300s = f"{station.name} - 300s - {alert.pk // GRAFANA_ALERTS_GROUP_SIZE + 1}"
+        Alert.objects.filter(pk=alert.pk).update(evaluation_frequency=5)
+        sync_alert_groups([str(station.pk)])
+        groups = {group["name"]: group for group in self.grafana.rules[GRAFANA_ALERTS_FOLDER]}
+        self.assertEqual(groups[group_300s]["interval"], "5m")
+        uid = groups[group_300s]["rules"][0]["grafana_alert"]["uid"]
+
+        # The 300s group is deleted once no alert of the station is evaluated every 5 minutes,
+        # its rule moves to the 600s group of the same alert ids and keeps its uid
+        Alert.objects.filter(pk=alert.pk).update(evaluation_frequency=10)
+        self.grafana.reset()
+        sync_alert_groups([str(station.pk)])
+        self.assertEqual(self.grafana.count("GET", "/api/ruler/"), 1)
+        self.assertEqual(self.grafana.count("POST", "/api/ruler/"), 1)
+        self.assertEqual(self.grafana.count("DELETE", "/api/ruler/"), 1)
+        names = {group["name"] for group in self.grafana.rules[GRAFANA_ALERTS_FOLDER]}
+        self.assertNotIn(group_300s, names)
+        self.assertTrue(all(name.startswith(f"{station.name} - 600s - ") for name in names))
+        uids = {
+            rule["grafana_alert"]["uid"]
+            for group in self.grafana.rules[GRAFANA_ALERTS_FOLDER]
+            for rule in group["rules"]
+        }
+        self.assertIn(uid, uids)
+
+    def test_alert_sync_only_pushes_changed_groups(self):
+        station_ids = [str(pk) for pk in Station.objects.values_list("pk", flat=True)]
+        sync_alert_groups(station_ids)
+        uids = {
+            rule["grafana_alert"]["title"]: rule["grafana_alert"]["uid"]
+            for groups in self.grafana.rules.values()
+            for group in groups
+            for rule in group["rules"]
+        }
+        self.grafana.reset()
+        sync_alert_groups(station_ids)
+        self.assertEqual(self.grafana.count("GET", "/api/ruler/"), 1)
+        self.assertEqual(self.grafana.count("POST"), 0)
+
+        alert = Alert.objects.select_related("parameter").first()
+        n_stations = (
+            Station.objects.filter(instrument__instrument_model=alert.parameter.instrument_model_id)
+            .distinct()
+            .count()
+        )
+        Alert.objects.filter(pk=alert.pk).update(message_summary="changed")
+        self.grafana.reset()
+        sync_alert_groups(station_ids)
+        self.assertEqual(self.grafana.count("POST", "/api/ruler/"), n_stations)
+        self.assertEqual(self.grafana.count("POST", "/api/folders"), 0)
+        self.assertEqual(
+            uids,
+            {
+                rule["grafana_alert"]["title"]: rule["grafana_alert"]["uid"]
+                for groups in self.grafana.rules.values()
+                for group in groups
+                for rule in group["rules"]
+            },
+        )
+
+    def rule_titles(self, station: Station):
+        return {
+            rule["grafana_alert"]["title"]
+            for group in self.grafana.rules.get(GRAFANA_ALERTS_FOLDER, [])
+            for rule in group["rules"]
+            if rule["labels"]["station"] == station.name
+        }
+
+    def test_new_instrument_syncs_the_rules_of_its_station(self):
+        station = Station.objects.first()
+        instrument = station.instrument_set.first()
+        other_model = InstrumentModel.objects.exclude(instrument__station=station).first()
+        with self.captureOnCommitCallbacks(execute=True):
+            Instrument.objects.create(
+                pid="https://hdl.handle.net/new",
+                date_start=instrument.date_start,
+                date_end=instrument.date_end,
+                is_active=True,
+                instrument_model=other_model,
+                station=station,
+                category=instrument.category,
+                contact_group=instrument.contact_group,
+            )
+        new_titles = [title for title in self.rule_titles(station) if f" - {other_model.model} - " in title]
+        self.assertEqual(len(new_titles), PARAMETERS_PER_MODEL)
+
+    def test_instrument_moved_through_the_bulk_route_leaves_its_previous_station(self):
+        old_station = Station.objects.first()
+        instrument = old_station.instrument_set.select_related("instrument_model").first()
+        new_station = Station.objects.exclude(instrument__instrument_model=instrument.instrument_model).first()
+        sync_alert_groups([str(old_station.pk)])
+        model_part = f" - {instrument.instrument_model.model} - "
+        self.assertTrue([title for title in self.rule_titles(old_station) if model_part in title])
+
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.patch(
+                "/api/v1/instrument/bulk/", [{"id": instrument.pk, "station": new_station.pk}], format="json"
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([title for title in self.rule_titles(old_station) if model_part in title])
+        moved_titles = [title for title in self.rule_titles(new_station) if model_part in title]
+        self.assertEqual(len(moved_titles), PARAMETERS_PER_MODEL)
+
+    def test_moved_alert_leaves_the_stations_of_its_previous_parameter(self):
+        alert = Alert.objects.select_related("parameter").first()
+        old_station = Station.objects.filter(instrument__instrument_model=alert.parameter.instrument_model_id).first()
+        other_model = InstrumentModel.objects.exclude(instrument__station=old_station).first()
+        sync_alert_groups([str(old_station.pk)])
+        self.assertTrue([title for title in self.rule_titles(old_station) if title.endswith(f" #{alert.pk}")])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            alert.parameter = Parameter.objects.filter(instrument_model=other_model).first()
+            alert.save()
+        self.assertFalse([title for title in self.rule_titles(old_station) if title.endswith(f" #{alert.pk}")])
+
+    def test_deleted_station_loses_its_rule_groups(self):
+        station, other_station = Station.objects.all()[:2]
+        sync_alert_groups([str(station.pk), str(other_station.pk)])
+        with self.captureOnCommitCallbacks(execute=True):
+            Instrument.objects.filter(station=station).delete()
+            Station.objects.filter(pk=station.pk).delete()
+        self.assertFalse(self.rule_titles(station))
+        self.assertTrue(self.rule_titles(other_station))
+
+    def test_legacy_rule_groups_are_deleted(self):
+        station, other_station = Station.objects.all()[:2]
+        sync_alert_groups([str(other_station.pk)])
+        other_names = {group["name"] for group in self.grafana.rules[GRAFANA_ALERTS_FOLDER]}
+        # Left by the previous layouts: a group without labels, one group per station
+        for name, labels in [("Alerts", {}), (station.name, {"station": station.name})]:
+            rule = {"for": "0s", "labels": labels, "grafana_alert": {"title": f"{name} rule"}}
+            self.grafana.handle("POST", f"{RULER_PREFIX}/{GRAFANA_ALERTS_FOLDER}", {}, {"name": name, "rules": [rule]})
+
+        sync_alert_groups([str(station.pk)])
+        names = {group["name"] for group in self.grafana.rules[GRAFANA_ALERTS_FOLDER]}
+        self.assertNotIn("Alerts", names)
+        self.assertNotIn(station.name, names)
+        self.assertLessEqual(other_names, names)
+        self.assertTrue(self.rule_titles(station))
+
+    def test_fake_ruler_refuses_unknown_rule_uids(self):
+        rule = {"for": "0s", "labels": {}, "grafana_alert": {"title": "rule", "uid": "missing"}}
+        status, _ = self.grafana.handle(
+            "POST", f"{RULER_PREFIX}/{GRAFANA_ALERTS_FOLDER}", {}, {"name": "group", "rules": [rule]}
+        )
+        self.assertEqual(status, 404)
+        self.assertFalse(self.grafana.rules.get(GRAFANA_ALERTS_FOLDER))
+
+    def test_contact_added_to_group(self):
+        contact_group = AlertContactGroup.objects.get(name="team")
+        contact = AlertContact.objects.create(name="pi", email="pi@example.org")
+        with self.assertBudget(10, SYNC_MAX_SECONDS):
+            with self.captureOnCommitCallbacks(execute=True):
+                contact.groups.add(contact_group)
+
+        # Fetched to build the change, then again right before the POST
+        self.assertEqual(self.grafana.count("GET", "/api/alertmanager/"), 2)
+        self.assertEqual(self.grafana.count("POST", "/api/alertmanager/"), 1)
+
+    def test_contact_added_to_several_groups(self):
+        groups = AlertContactGroup.objects.bulk_create(AlertContactGroup(name=f"team{i}") for i in range(5))
+        contact = AlertContact.objects.create(name="pi", email="pi@example.org")
+        with self.assertBudget(10, SYNC_MAX_SECONDS):
+            with self.captureOnCommitCallbacks(execute=True):
+                contact.groups.add(*groups)
+
+        self.assertEqual(self.grafana.count("GET", "/api/alertmanager/"), 2)
+        self.assertEqual(self.grafana.count("POST", "/api/alertmanager/"), 1)
+        receivers = {
+            receiver["name"]: receiver["grafana_managed_receiver_configs"][0]["settings"]["addresses"]
+            for receiver in self.grafana.alertmanager_config["alertmanager_config"]["receivers"]
+        }
+        self.assertEqual(receivers, {group.name: "pi@example.org" for group in groups})
+
+    def test_unchanged_contact_groups_are_not_pushed(self):
+        group_ids = [str(pk) for pk in AlertContactGroup.objects.values_list("pk", flat=True)]
+        sync_contact_groups(group_ids)
+        self.grafana.reset()
+        sync_contact_groups(group_ids)
+        self.assertEqual(self.grafana.count("GET", "/api/alertmanager/"), 1)
+        self.assertEqual(self.grafana.count("POST", "/api/alertmanager/"), 0)
+
+    def test_conflicting_contact_push_is_reapplied(self):
+        self.grafana.inject_error(409, "POST", "/api/alertmanager/")
+        sync_contact_groups([str(AlertContactGroup.objects.get(name="team").pk)])
+        # Fetched and checked before each POST
+        self.assertEqual(self.grafana.count("GET", "/api/alertmanager/"), 4)
+        self.assertEqual(self.grafana.count("POST", "/api/alertmanager/"), 2)
+        receivers = self.grafana.alertmanager_config["alertmanager_config"]["receivers"]
+        self.assertEqual([receiver["name"] for receiver in receivers], ["team"])
+
+    def test_contact_push_keeps_a_concurrent_change(self):
+        manager = NotificationManager(self.grafana.url, get_grafana_session())
+        manager.add_contact_point({"name": "team", "type": "email", "settings": {"addresses": "pi@example.org"}})
+        # Another worker pushes its receiver after this configuration was fetched
+        self.grafana.alertmanager_config["alertmanager_config"]["receivers"].append(
+            {"name": "other", "grafana_managed_receiver_configs": []}
+        )
+        manager.push()
+        self.assertEqual(self.grafana.count("POST", "/api/alertmanager/"), 1)
+        receivers = self.grafana.alertmanager_config["alertmanager_config"]["receivers"]
+        self.assertEqual([receiver["name"] for receiver in receivers], ["other", "team"])
+
+    def test_transient_grafana_errors_are_retried(self):
+        self.grafana.inject_error(503, "POST", "/api/dashboards/db", times=2)
+        sync_dashboards(["all"])
+        self.assertEqual(len(self.grafana.dashboards), N_STATIONS * INSTRUMENTS_PER_STATION)
+        self.assertEqual(
+            self.grafana.count("POST", "/api/dashboards/db"), N_STATIONS * INSTRUMENTS_PER_STATION + 2
+        )
@@ -1,6 +1,17 @@
-from django.shortcuts import render
+from typing import Any, Dict, List, Optional, Type
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from django.db.models import Prefetch
+from django.db.models.signals import post_save
+from django.shortcuts import get_object_or_404, render
+from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.permissions import IsAuthenticated
-from rest_framework import viewsets
+from rest_framework import filters, relations, serializers, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.request import Request
+from rest_framework.response import Response
 from .serializers import (
     StationSerializer,
     InfluxSerializer,
@@ -8,7 +19,9 @@ from .serializers import (
     InstrumentSerializer,
     GrafanaSerializer,
     GrafanaDashboardSerializer,
+    GrafanaDashboardSummarySerializer,
     GrafanaPanelSerializer,
+    GrafanaPanelSummarySerializer,
     AlertSerializer,
     AlertContactGroupSerializer,
     AlertContactSerializer,
@@ -16,9 +29,16 @@ from .serializers import (
     ParameterSerializer,
     PreprocessingSerializer,
     FirmwareSerializer,
+    StationTreeSerializer,
+    get_requested_fields,
 )
+from .caching import CachedReadMixin
+from .pagination import HkdCursorPagination
+from .provisioning import batch
+from .provisioning.graph import get_loaded_values
 from .models import (
     Station,
+    InstrumentModel,
     Influx,
     InfluxSource,
     Instrument,
@@ -38,85 +58,334 @@ from .models import (
 # Create your views here.
 
 
-class StationViewSet(viewsets.ModelViewSet):
+class BulkMixin:
+    """`bulk/` route writing many objects in one request
+
+    - POST a list of objects to create them
+    - PATCH a list of objects with their `id` to update them
+    - DELETE a list of ids to delete them
+
+    The objects are validated together against related objects fetched once for all the rows,
+    then written with `bulk_create`/`bulk_update` in one transaction. `post_save` is sent for
+    each object inside a provisioning `batch()`, so the whole request ends in a single Grafana sync.
+    """
+
+    @action(detail=False, methods=["post", "patch", "delete"], url_path="bulk")
+    def bulk(self, request: Request) -> Response:
+        if request.method == "POST":
+            return self.bulk_create(request)
+        if request.method == "PATCH":
+            return self.bulk_update(request)
+        return self.bulk_destroy(request)
+
+    def get_bulk_ids(self, ids: Any) -> List[Any]:
+        """Primary keys of a bulk request, a 400 when one of them is not valid"""
+        pk_field = self.get_queryset().model._meta.pk
+        try:
+            return [pk_field.to_python(pk) for pk in ids]
+        except DjangoValidationError:
+            raise ValidationError({"non_field_errors": ["Invalid id."]})
+
+    def get_related_objects(self, rows: List[Any]) -> Dict[Type, Dict[Any, Any]]:
+        """Objects referenced by the relations of the rows, fetched with one query per relation"""
+        rows = [row for row in rows if isinstance(row, dict)]
+        related: Dict[Type, Dict[Any, Any]] = {}
+        for name, field in self.get_serializer().fields.items():
+            if field.read_only:
+                continue
+            if isinstance(field, relations.ManyRelatedField):
+                field = field.child_relation
+                values = [pk for row in rows if isinstance(row.get(name), list) for pk in row[name]]
+            elif isinstance(field, relations.PrimaryKeyRelatedField):
+                values = [row[name] for row in rows if row.get(name) is not None]
+            else:
+                continue
+            queryset = field.get_queryset()
+            pks = set()
+            for value in values:
+                try:
+                    pks.add(queryset.model._meta.pk.to_python(value))
+                except DjangoValidationError:
+                    continue  # reported by the field
+            related.setdefault(queryset.model, {}).update(queryset.in_bulk(pks))
+        return related
+
+    def bulk_create(self, request: Request) -> Response:
+        context = self.get_serializer_context()
+        if isinstance(request.data, list):
+            context["related_objects"] = self.get_related_objects(request.data)
+        serializer = self.get_serializer(data=request.data, many=True, context=context)
+        serializer.is_valid(raise_exception=True)
+
+        model = self.get_queryset().model
+        m2m_names = {field.name for field in model._meta.many_to_many}
+        instances, relations = [], []
+        for data in serializer.validated_data:
+            instances.append(model(**{k: v for k, v in data.items() if k not in m2m_names}))
+            relations.append({k: v for k, v in data.items() if k in m2m_names})
+
+        with transaction.atomic(), batch():
+            model.objects.bulk_create(instances)
+            for instance, instance_relations in zip(instances, relations):
+                for name, values in instance_relations.items():
+                    getattr(instance, name).set(values)
+            for instance in instances:
+                post_save.send(sender=model, instance=instance, created=True)
+
+        data = self.get_serializer(instances, many=True).data
+        return Response(data, status=status.HTTP_201_CREATED)
+
+    def bulk_update(self, request: Request) -> Response:
+        items = request.data
+        if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+            raise ValidationError({"non_field_errors": ["Expected a list of objects."]})
+
+        queryset = self.get_queryset()
+        ids = self.get_bulk_ids([item.get("id") for item in items])
+        known = queryset.in_bulk(ids)
+        context = self.get_serializer_context()
+        context["related_objects"] = self.get_related_objects(items)
+        serializers_, errors = [], []
+        for item, pk in zip(items, ids):
+            instance = known.get(pk)
+            if instance is None:
+                errors.append({"id": ["Unknown object."]})
+                continue
+            item_serializer = self.get_serializer(instance, data=item, partial=True, context=context)
+            errors.append({} if item_serializer.is_valid() else item_serializer.errors)
+            serializers_.append(item_serializer)
+        if any(errors):
+            raise ValidationError(errors)
+
+        model = queryset.model
+        m2m_names = {field.name for field in model._meta.many_to_many}
+        updated_fields = set()
+        for item_serializer in serializers_:
+            # `pre_save` is not sent: keep the location the instance is moved from, as it does
+            item_serializer.instance._provisioning_previous = get_loaded_values(model, item_serializer.instance)
+            for name, value in item_serializer.validated_data.items():
+                if name not in m2m_names:
+                    setattr(item_serializer.instance, name, value)
+                    updated_fields.add(name)
+        instances = [item_serializer.instance for item_serializer in serializers_]
+
+        with transaction.atomic(), batch():
+            if updated_fields:
+                model.objects.bulk_update(instances, list(updated_fields))
+            for item_serializer in serializers_:
+                for name, values in item_serializer.validated_data.items():
+                    if name in m2m_names:
+                        getattr(item_serializer.instance, name).set(values)
+            for instance in instances:
+                post_save.send(
+                    sender=model,
+                    instance=instance,
+                    created=False,
+                    update_fields=frozenset(updated_fields),
+                )
+
+        return Response(self.get_serializer(instances, many=True).data)
+
+    def bulk_destroy(self, request: Request) -> Response:
+        if not isinstance(request.data, list):
+            raise ValidationError({"non_field_errors": ["Expected a list of ids."]})
+        ids = self.get_bulk_ids(request.data)
+
+        # QuerySet.delete sends post_delete for every object, the batch collapses their jobs
+        with transaction.atomic(), batch():
+            self.get_queryset().filter(pk__in=ids).delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class HkdViewSet(BulkMixin, viewsets.ModelViewSet):
+    """Base of the hkd viewsets, lists are paginated with a cursor
+
+    `?fields=id,name` restricts both the serialized fields and the columns read from the database.
+    Without it, the lists use `summary_serializer_class` (when set) and do not read `deferred_fields`.
+
+    The lists are filtered on `filterset_fields` (`?station=1`), searched on `search_fields`
+    (`?search=`) and ordered on `ordering_fields` (`?ordering=-name`).
+    """
+
+    pagination_class = HkdCursorPagination
+    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filterset_fields: List[str] = []
+    search_fields: List[str] = []
+    ordering_fields: List[str] = ["pk"]
+    ordering = "pk"
+    summary_serializer_class: Optional[Type[serializers.Serializer]] = None
+    deferred_fields: List[str] = []
+
+    def get_serializer_class(self):
+        if (
+            self.action == "list"
+            and self.summary_serializer_class is not None
+            and get_requested_fields(self.request) is None
+        ):
+            return self.summary_serializer_class
+        return super().get_serializer_class()
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action not in ("list", "retrieve"):
+            return queryset
+
+        requested = get_requested_fields(self.request)
+        if requested is not None:
+            concrete_fields = {field.name for field in queryset.model._meta.concrete_fields}
+            return queryset.only(*[field for field in requested if field in concrete_fields])
+        if self.action == "list" and self.deferred_fields:
+            return queryset.defer(*self.deferred_fields)
+        return queryset
+
+
+class StationViewSet(CachedReadMixin, HkdViewSet):
     serializer_class = StationSerializer
     queryset = Station.objects.all()
     permission_class = [IsAuthenticated]
+    filterset_fields = ["name"]
+    search_fields = ["name"]
+    ordering_fields = ["pk", "name", "altitude"]
+    cache_models = [Station]
+    tree_cache_models = [Station, Instrument, InstrumentModel, Parameter, Preprocessing, Alert]
+
+    @action(detail=True, methods=["get"])
+    def tree(self, request: Request, pk=None) -> Response:
+        """Station with its whole instrument/parameter/alert tree, in a constant number of queries"""
+        return self.cached_response(self.tree_cache_models, self._tree, request, pk=pk)
+
+    def _tree(self, request: Request, pk=None) -> Response:
+        queryset = Station.objects.prefetch_related(
+            Prefetch(
+                "instrument_set",
+                queryset=Instrument.objects.select_related(
+                    "instrument_model", "category", "contact_group"
+                ).order_by("pk"),
+            ),
+            Prefetch(
+                "instrument_set__instrument_model__parameter_set",
+                queryset=Parameter.objects.order_by("pk"),
+            ),
+            Prefetch(
+                "instrument_set__instrument_model__parameter_set__preprocessing_set",
+                queryset=Preprocessing.objects.order_by("pk"),
+            ),
+            Prefetch(
+                "instrument_set__instrument_model__parameter_set__alert_set",
+                queryset=Alert.objects.order_by("pk"),
+            ),
+        )
+        station = get_object_or_404(queryset, pk=pk)
+        return Response(StationTreeSerializer(station).data)
 
 
-class InstrumentViewSet(viewsets.ModelViewSet):
+class InstrumentViewSet(CachedReadMixin, HkdViewSet):
     serializer_class = InstrumentSerializer
     queryset = Instrument.objects.all()
     permission_class = [IsAuthenticated]
+    cache_models = [Instrument]
+    filterset_fields = ["station", "instrument_model", "category", "contact_group", "is_active"]
+    search_fields = ["pid"]
+    ordering_fields = ["pk", "date_start", "date_end"]
 
 
-class GrafanaViewSet(viewsets.ModelViewSet):
+class GrafanaViewSet(HkdViewSet):
     serializer_class = GrafanaSerializer
     queryset = Grafana.objects.all()
     permission_class = [IsAuthenticated]
+    filterset_fields = ["version"]
 
 
-class GrafanaPanelViewSet(viewsets.ModelViewSet):
+class GrafanaPanelViewSet(HkdViewSet):
     serializer_class = GrafanaPanelSerializer
+    summary_serializer_class = GrafanaPanelSummarySerializer
+    deferred_fields = ["content"]
     queryset = GrafanaPanel.objects.all()
     permission_class = [IsAuthenticated]
+    filterset_fields = ["dashboard", "name"]
+    search_fields = ["name"]
+    ordering_fields = ["pk", "name"]
 
 
-class GrafanaDashboardViewSet(viewsets.ModelViewSet):
+class GrafanaDashboardViewSet(HkdViewSet):
     serializer_class = GrafanaDashboardSerializer
+    summary_serializer_class = GrafanaDashboardSummarySerializer
+    deferred_fields = ["content"]
     queryset = GrafanaDashboard.objects.all()
     permission_class = [IsAuthenticated]
+    filterset_fields = ["grafana", "name", "source"]
+    search_fields = ["name"]
+    ordering_fields = ["pk", "name"]
 
 
-class InfluxViewSet(viewsets.ModelViewSet):
+class InfluxViewSet(HkdViewSet):
     serializer_class = InfluxSerializer
     queryset = Influx.objects.all()
     permission_class = [IsAuthenticated]
+    filterset_fields = ["version"]
 
 
-class InfluxSourceViewSet(viewsets.ModelViewSet):
+class InfluxSourceViewSet(HkdViewSet):
     serializer_class = InfluxSourceSerializer
     queryset = InfluxSource.objects.all()
     permission_class = [IsAuthenticated]
+    filterset_fields = ["influx", "bucket", "measurement"]
 
 
-class ParameterViewSet(viewsets.ModelViewSet):
+class ParameterViewSet(CachedReadMixin, HkdViewSet):
     serializer_class = ParameterSerializer
     queryset = Parameter.objects.all()
     permission_class = [IsAuthenticated]
+    cache_models = [Parameter]
+    filterset_fields = ["instrument_model", "name", "file_type"]
+    search_fields = ["name", "comment"]
+    ordering_fields = ["pk", "name"]
 
 
-class FirmwareViewSet(viewsets.ModelViewSet):
+class FirmwareViewSet(CachedReadMixin, HkdViewSet):
     serializer_class = FirmwareSerializer
     queryset = Firmware.objects.all()
     permission_class = [IsAuthenticated]
+    cache_models = [Firmware]
+    filterset_fields = ["instrument_model", "version"]
 
 
-class PreprocessingViewSet(viewsets.ModelViewSet):
+class PreprocessingViewSet(HkdViewSet):
     serializer_class = PreprocessingSerializer
     queryset = Preprocessing.objects.all()
     permission_class = [IsAuthenticated]
+    filterset_fields = ["parameter", "required"]
 
 
-class AlertContactGroupViewSet(viewsets.ModelViewSet):
+class AlertContactGroupViewSet(HkdViewSet):
     serializer_class = AlertContactGroupSerializer
     queryset = AlertContactGroup.objects.all()
     permission_class = [IsAuthenticated]
+    filterset_fields = ["name"]
+    search_fields = ["name"]
+    ordering_fields = ["pk", "name"]
 
 
-class AlertContactViewSet(viewsets.ModelViewSet):
+class AlertContactViewSet(HkdViewSet):
     serializer_class = AlertContactSerializer
-    queryset = AlertContact.objects.all()
+    queryset = AlertContact.objects.prefetch_related("groups")
     permission_class = [IsAuthenticated]
+    filterset_fields = ["groups", "email"]
+    search_fields = ["name", "email"]
+    ordering_fields = ["pk", "name"]
 
 
-class AlertViewSet(viewsets.ModelViewSet):
+class AlertViewSet(HkdViewSet):
     serializer_class = AlertSerializer
     queryset = Alert.objects.all()
     permission_class = [IsAuthenticated]
+    filterset_fields = ["parameter", "parameter__instrument_model", "message_level", "evaluation_method"]
+    search_fields = ["title", "message_summary"]
+    ordering_fields = ["pk", "title", "message_level"]
 
 
-class AlertDependencyViewSet(viewsets.ModelViewSet):
+class AlertDependencyViewSet(HkdViewSet):
     serializer_class = AlertDependencySerializer
     queryset = AlertDependency.objects.all()
     permission_class = [IsAuthenticated]
+    filterset_fields = ["alert_left", "alert_right", "condition"]
@@ -1,62 +1,13 @@
-from typing import Any, Dict, List, Optional, Union
+from typing import Any, Dict, List, Optional, Set, Union
 
 import requests
-from .base import AcceptableCodes, get_encodable_dict
+from .base import AcceptableCodes, get_encodable_dict, is_subset, LazyFetchMixin, parse_duration
+from .client import map_concurrently
 from grafanalib.core import AlertGroup
 from pprint import pprint as print
 
 
-def _find_pos_of_alert_group(grafana_json_folder_copy: Dict[Any, Any], group) -> Optional[int]:
-    """Find position of the alert group in the original grafana JSON"""
-    for i, alert_group in enumerate(grafana_json_folder_copy):
-        for value in alert_group.values():
-            if group.get("name") == value:
-                return i
-    return None
-
-
-def _find_pos_of_alert(alert_group_json: Dict[Any, Any], group) -> Optional[int]:
-    """Find position of the alert in the alert group of the original grafana JSON"""
-    for i, alert in enumerate(alert_group_json):
-        if alert["grafana_alert"]["title"] == group["grafana_alert"]["title"]:
-            return i
-    return None
-
-
-def _insert_into_existing_json(grafana_json_copy, folder, alert_group):
-    """
-    Insert json into the original grafana json and extract the sub folder JSON.
-    """
-    # TODO: Finish this :
-    # Get this error
-    # b'{"message":"failed to update rule group: failed to add rules: a conflicting alert rule is
-    # found: rule title under the same organisation and folder should be unique","traceID":""}'
-    alert_group_json = get_encodable_dict(alert_group)
-
-    if folder not in grafana_json_copy:
-        grafana_json_copy[folder] = alert_group_json
-        return grafana_json_copy
-
-    alert_group_position = _find_pos_of_alert_group(grafana_json_copy[folder], alert_group)
-    if alert_group_position is None:
-        grafana_json_copy[folder].append(alert_group_json)
-        return grafana_json_copy
-
-    for rule in alert_group["rules"]:
-        alert_position = _find_pos_of_alert(
-            grafana_json_copy[folder][alert_group_position]["rules"],
-            rule,
-        )
-        if alert_position is None:
-            grafana_json_copy[folder][alert_group_position]["rules"].append(rule)
-            return grafana_json_copy
-
-        grafana_json_copy[folder][alert_group_position]["rules"][alert_position] = rule
-
-    return grafana_json_copy
-
-
-class AlertManager:
+class AlertManager(LazyFetchMixin):
     """Class that handle the creation of alert rules
 
     We can add multiple contact points or notification policies and then we push
@@ -68,20 +19,13 @@ class AlertManager:
         self.session = session
         self.endpoint = f"{self.url}/ruler/grafana/api/v1/rules"
         self.endpoint_folders = f"{self.url}/folders"
-        self.fetched_json: Dict[Any, Any] = self.fetch()
+        self.fetch_endpoint = self.endpoint
         self._alerts: Dict[Any, Any] = {}
+        self._namespaces: Dict[str, Dict[str, Dict[Any, Any]]] = {}
 
-    def get_fetched_json(self) -> Any:
-        return self.fetched_json
-
-    def fetch(self) -> Dict[Any, Any]:
-        res = self.session.get(self.endpoint)
-        if res.status_code not in AcceptableCodes.list():
-            msg = "Unable to get the current configuration\n"
-            msg += f"[{res.status_code}] : {res.content}"
-            raise requests.HTTPError(msg)
-        self.fetched_json = res.json()
-        return self.fetched_json
+    def invalidate(self):
+        super().invalidate()
+        self._namespaces = {}
 
     def add_alert(
         self, alertgroup: Union[AlertGroup, Dict[Any, Any]], folder: Optional[str] = None
@@ -117,19 +61,18 @@ class AlertManager:
             self.session.post(f"{self.endpoint_folders}", json={"title": folder})
 
             full_json_to_send = {}
+            titles: Set[str] = set()
             for alert_group in alert_groups:
                 alert_group_json = get_encodable_dict(alert_group)
                 if full_json_to_send == {}:
-                    full_json_to_send = alert_group_json
-                    continue
+                    full_json_to_send = {**alert_group_json, "rules": []}
 
                 for rule in alert_group_json.get("rules", []):
-                    if any(
-                        existing_rule["grafana_alert"]["title"] == rule["grafana_alert"]["title"]
-                        for existing_rule in full_json_to_send.get("rules", [])
-                    ):
+                    title = rule["grafana_alert"]["title"]
+                    if title in titles:
                         continue
 
+                    titles.add(title)
                     full_json_to_send["rules"].append(rule)
 
             res: requests.Response = self.session.post(
@@ -138,31 +81,139 @@ class AlertManager:
             responses[folder] = res
         return responses
 
-    def _push_without_deleting(self) -> Dict[str, requests.Response]:
+    def _merge_alert_groups(self, alert_groups: List[Dict[Any, Any]]) -> Dict[str, Dict[Any, Any]]:
+        """Merge the added alert groups by name, dropping rules whose title already exists
+
+        Grafana refuses two rules of the same title in a folder: the title must identify the rule.
         """
-        Pushes the alert data to Grafana without deleting any existing alerts.
-        The new alerts will be added to the existing ones in the same folder.
+        merged: Dict[str, Dict[Any, Any]] = {}
+        titles: Dict[str, Set[str]] = {}
+        for alert_group in alert_groups:
+            alert_group_json = get_encodable_dict(alert_group)
+            name = alert_group_json["name"]
+            if name not in merged:
+                merged[name] = {**alert_group_json, "rules": []}
+                titles[name] = set()
+
+            for rule in alert_group_json.get("rules", []):
+                title = rule["grafana_alert"]["title"]
+                if title in titles[name]:
+                    continue
+
+                titles[name].add(title)
+                merged[name]["rules"].append(rule)
+        return merged
+
+    @staticmethod
+    def _parse_durations(alert_group: Dict[Any, Any]) -> Dict[Any, Any]:
+        """Copy of the group with its interval and the `for` of its rules in seconds, to compare
+        the groups sent with the ones returned by Grafana in its own duration format"""
+        alert_group = dict(alert_group)
+        if "interval" in alert_group:
+            alert_group["interval"] = parse_duration(alert_group["interval"])
+        alert_group["rules"] = [
+            dict(rule, **{"for": parse_duration(rule["for"])}) if "for" in rule else rule
+            for rule in alert_group.get("rules", [])
+        ]
+        return alert_group
+
+    def _post_groups(self, folder: str, alert_groups: List[Dict[Any, Any]]) -> Dict[str, requests.Response]:
+        """POST each group to the ruler API of the folder, concurrently when the session is a GrafanaClient"""
+
+        def _push_group(alert_group_json: Dict[Any, Any]) -> requests.Response:
+            res: requests.Response = self.session.post(f"{self.endpoint}/{folder}", json=alert_group_json)
+            if res.status_code not in AcceptableCodes.list():
+                msg = f"Error pushing the group {alert_group_json['name']} of the folder {folder} : "
+                msg += f"[{res.status_code}] : {res.content}"
+                raise requests.HTTPError(msg)
+            return res
+
+        group_responses = map_concurrently(self.session, _push_group, alert_groups)
+        return {
+            f"{folder}/{alert_group['name']}": res for alert_group, res in zip(alert_groups, group_responses)
+        }
+
+    def fetch_namespace(self, folder: str) -> Dict[str, Dict[Any, Any]]:
+        """Rule groups of the folder, keyed by name. A folder without rules gives an empty dict.
+
+        The groups are fetched once, until the manager pushes or deletes something.
+        """
+        if folder in self._namespaces:
+            return self._namespaces[folder]
+
+        res: requests.Response = self.session.get(f"{self.endpoint}/{folder}")
+        if res.status_code == 404:
+            groups = []
+        elif res.status_code not in AcceptableCodes.list():
+            msg = f"Unable to get the rules of the folder {folder}\n"
+            msg += f"[{res.status_code}] : {res.content}"
+            raise requests.HTTPError(msg)
+        else:
+            groups = res.json().get(folder, [])
+        self._namespaces[folder] = {alert_group["name"]: alert_group for alert_group in groups}
+        return self._namespaces[folder]
+
+    def upsert_groups(self) -> Dict[str, requests.Response]:
+        """
+        Pushes the added alert groups whose content differs from the one in Grafana.
+
+        The rule groups of each folder are fetched once. A group that Grafana already holds
+        as is (the fields Grafana adds aside) is not sent, and the rules of a changed group keep
+        the uid of the existing rule of the same title, so Grafana updates them in place
+        instead of refusing a second rule with the same title. The groups taking a rule from
+        another group are pushed before the others, which may be the group losing it.
 
         Returns:
-            requests.Response: Response object from the POST request.
+            Dict[str, requests.Response]: Response of each pushed group, keyed by "<folder>/<group>".
+
+        Raises:
+            requests.HTTPError: If the response status code is not in the acceptable list.
         """
         responses = {}
         for folder, alert_groups in self._alerts.items():
-            self.session.post(f"{self.endpoint_folders}", json={"title": folder})
-
-            full_json_to_send = self.fetched_json.copy()
-            for alert_group in alert_groups:
-                full_json_to_send = _insert_into_existing_json(
-                    full_json_to_send, folder, alert_group
-                )
-            # Need to access the 0 element since grafana response is a list
-            # containing  one element
-            res: requests.Response = self.session.post(
-                f"{self.endpoint}/{folder}", json=full_json_to_send[folder][0]
-            )
-            responses[folder] = res
+            existing_groups = self.fetch_namespace(folder)
+            if not existing_groups:
+                self.session.post(f"{self.endpoint_folders}", json={"title": folder})
+            existing_rules = {
+                rule["grafana_alert"]["title"]: (existing_name, rule["grafana_alert"])
+                for existing_name, existing_group in existing_groups.items()
+                for rule in existing_group.get("rules", [])
+            }
+
+            receiving_groups, other_groups = [], []
+            for name, alert_group in self._merge_alert_groups(alert_groups).items():
+                if name in existing_groups and is_subset(
+                    self._parse_durations(alert_group), self._parse_durations(existing_groups[name])
+                ):
+                    continue
+                receives = False
+                for rule in alert_group["rules"]:
+                    existing_name, existing_rule = existing_rules.get(rule["grafana_alert"]["title"], (name, {}))
+                    if "uid" in existing_rule and "uid" not in rule["grafana_alert"]:
+                        rule["grafana_alert"]["uid"] = existing_rule["uid"]
+                        receives = receives or existing_name != name
+                (receiving_groups if receives else other_groups).append(alert_group)
+
+            # A group posted without a rule deletes it: the groups taking a rule from another group
+            # go first, so the rule still exists when its uid is sent
+            responses.update(self._post_groups(folder, receiving_groups))
+            responses.update(self._post_groups(folder, other_groups))
+        self.invalidate()
         return responses
 
+    def delete_alert_group(self, name: str, folder: Optional[str] = None) -> requests.Response:
+        """Delete one alert group of the folder. A group that does not exist is ignored."""
+        if folder is None:
+            folder = "Alerts"
+
+        response: requests.Response = self.session.delete(f"{self.endpoint}/{folder}/{name}")
+        if response.status_code not in AcceptableCodes.list() + [404]:
+            msg = f"Error deleting the group {name} of the folder {folder} : "
+            msg += f"[{response.status_code}] : {response.content}"
+            raise requests.HTTPError(msg)
+        self.invalidate()
+        return response
+
     def delete_folder(self, folder: str) -> requests.Response:
         response: requests.Response = self.session.delete(f"{self.endpoint}/{folder}")
         print(response.content)
@@ -170,6 +221,7 @@ class AlertManager:
             msg = f"Error pushing the folder {folder} : "
             msg += f"[{response.status_code}] : {response.content}"
             raise requests.HTTPError(msg)
+        self.invalidate()
         return response
 
     def push(self, delete_existing: bool = False) -> requests.Response:
@@ -178,7 +230,7 @@ class AlertManager:
 
         Args:
             delete_existing (bool): If True, delete any existing alerts before pushing new ones.
-                                    If False, add new alerts to the existing ones.
+                                    If False, upsert the groups (see `upsert_groups`).
 
         Returns:
             requests.Response: Response object from the POST request.
@@ -186,14 +238,15 @@ class AlertManager:
         Raises:
             requests.HTTPError: If the response status code is not in the acceptable list.
         """
-        if delete_existing:
-            responses = self._push_with_deleting()
-        else:
-            responses = self._push_without_deleting()
+        if not delete_existing:
+            return self.upsert_groups()
+
+        responses = self._push_with_deleting()
 
         for folder, response in responses.items():
             if response.status_code not in AcceptableCodes.list():
                 msg = f"Error pushing the folder {folder} : "
                 msg += f"[{response.status_code}] : {response.content}"
                 raise requests.HTTPError(msg)
+        self.invalidate()
         return responses
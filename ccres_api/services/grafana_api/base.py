@@ -1,7 +1,12 @@
 from enum import Enum
-from typing import Dict, Any
-import json
-from grafanalib._gen import DashboardEncoder
+from typing import Dict, Any, Optional
+import re
+import requests
+
+DURATION_UNITS = {"y": 365 * 86400, "w": 7 * 86400, "d": 86400, "h": 3600, "m": 60, "s": 1, "ms": 0.001}
+_DURATION = re.compile(r"(\d+)(ms|y|w|d|h|m|s)")
+
+
 class AcceptableCodes(Enum):
     OK = 200  # Ok
     POSTACCEPTED = 202
@@ -12,13 +17,52 @@ class AcceptableCodes(Enum):
     def list(cls):
         return list(map(lambda c: c.value, cls))
 
-def get_encodable_dict(obj:Dict[Any,Any])->Dict[Any,Any]:
+
+def _encode_key(key: Any) -> str:
+    """Convert a dictionnary key the way `json.dumps` does"""
+    if isinstance(key, str):
+        return str.__str__(key)
+    if key is True:
+        return "true"
+    if key is False:
+        return "false"
+    if key is None:
+        return "null"
+    if isinstance(key, int):
+        return int.__repr__(key)
+    if isinstance(key, float):
+        return float.__repr__(key)
+    raise TypeError(f"keys must be str, int, float, bool or None, not {type(key).__name__}")
+
+
+def _to_encodable(obj: Any) -> Any:
+    """Convert obj to plain JSON types, checking the types in the order of `json.JSONEncoder`"""
+    if isinstance(obj, str):
+        return str.__str__(obj)
+    if obj is None or obj is True or obj is False:
+        return obj
+    if isinstance(obj, int):
+        return int(obj)
+    if isinstance(obj, float):
+        return float(obj)
+    if isinstance(obj, (list, tuple)):
+        return [_to_encodable(value) for value in obj]
+    if isinstance(obj, dict):
+        return {_encode_key(key): _to_encodable(value) for key, value in obj.items()}
+    # Same fallback as grafanalib DashboardEncoder.default
+    to_json_data = getattr(obj, "to_json_data", None)
+    if to_json_data:
+        return _to_encodable(to_json_data())
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def get_encodable_dict(obj: Dict[Any, Any]) -> Dict[Any, Any]:
     """Get encodable dictionnary
 
-    We need to dump it to ensure the DashboardEncoder execution that call 
-    to_json_data on every child
-    We need to reload it since the data or json does not work with `requests`.
-    The behaviour is not really the same between `requests` and `json`
+    Walk the object once, calling `to_json_data` on every grafanalib child
+    (as DashboardEncoder does) and returning plain dict, list, str, int, float,
+    bool and None that `requests` can send as JSON.
+
     Parameters
     ----------
     obj : Dict[Any,Any]
@@ -29,7 +73,69 @@ def get_encodable_dict(obj:Dict[Any,Any])->Dict[Any,Any]:
     Dict[Any,Any]
         the encodable dictionnary.
     """
-    json_str = json.dumps(obj, sort_keys=True, indent=2, cls=DashboardEncoder)
-    json_dict:Dict[Any,Any] = json.loads(json_str)
+    return _to_encodable(obj)
+
+
+def is_subset(new: Any, current: Any) -> bool:
+    """Whether `current` already holds `new`, the extra keys set by Grafana (uid, ...) aside
+
+    A key of `new` set to None also matches a missing key, Grafana omits the empty fields.
+    """
+    if isinstance(new, dict):
+        return isinstance(current, dict) and all(
+            is_subset(value, current[key]) if key in current else value is None for key, value in new.items()
+        )
+    if isinstance(new, list):
+        return (
+            isinstance(current, list)
+            and len(new) == len(current)
+            and all(is_subset(value, other) for value, other in zip(new, current))
+        )
+    return new == current
+
+
+def parse_duration(value: Any) -> Any:
+    """Seconds of a Prometheus duration ("600s", "10m", "1h30m"), other values unchanged
+
+    Grafana returns the durations it is sent in its own format, "600s" comes back as "10m".
+    """
+    if not isinstance(value, str):
+        return value
+    parts = _DURATION.findall(value)
+    if not parts or "".join(number + unit for number, unit in parts) != value:
+        return value
+    return sum(int(number) * DURATION_UNITS[unit] for number, unit in parts)
+
+
+class LazyFetchMixin:
+    """Fetch the remote state of a manager the first time it is needed
+
+    The state is then cached for the life of the manager (i.e. of a sync operation)
+    until `invalidate` is called. The manager must set `session` and `fetch_endpoint`.
+    """
+
+    session: requests.Session
+    fetch_endpoint: str
+    _fetched_json: Optional[Any] = None
+
+    @property
+    def fetched_json(self) -> Any:
+        if self._fetched_json is None:
+            self.fetch()
+        return self._fetched_json
+
+    def get_fetched_json(self) -> Any:
+        return self.fetched_json
+
+    def fetch(self) -> Any:
+        res = self.session.get(self.fetch_endpoint)
+        if res.status_code not in AcceptableCodes.list():
+            msg = "Unable to get the current configuration\n"
+            msg += f"[{res.status_code}] : {res.content}"
+            raise requests.HTTPError(msg)
+        self._fetched_json = res.json()
+        return self._fetched_json
 
-    return json_dict
\ No newline at end of file
+    def invalidate(self):
+        """Forget the fetched state, the next access fetches it again"""
+        self._fetched_json = None
@@ -0,0 +1,81 @@
+"""
+Benchmark of `get_encodable_dict` against the previous dump-and-reload implementation
+
+Run from the ccres_api directory with
+
+    python -m services.grafana_api.benchmarks.encoder
+"""
+import json
+import timeit
+import tracemalloc
+from typing import Any, Callable, Dict
+
+from grafanalib._gen import DashboardEncoder
+from grafanalib.core import Dashboard, GridPos, Target, TimeSeries
+
+from services.grafana_api.base import get_encodable_dict
+from services.grafana_api.query import FluxQueryBuilder
+
+
+def get_encodable_dict_roundtrip(obj: Dict[Any, Any]) -> Dict[Any, Any]:
+    """Previous implementation, kept as the reference"""
+    json_str = json.dumps(obj, sort_keys=True, indent=2, cls=DashboardEncoder)
+    return json.loads(json_str)
+
+
+def build_dashboard_payload(nb_panels: int) -> Dict[Any, Any]:
+    """Payload as sent by DashboardManager for an instrument model with nb_panels parameters"""
+    panels = []
+    for i in range(nb_panels):
+        flux_query = (
+            FluxQueryBuilder("mybucket")
+            .range(start="v.timeRangeStart", stop="v.timeRangeStop")
+            .filter(on="_measurement", what="CHM15K")
+            .filter(on="_field", what=f"parameter_{i}")
+            .filter(on="site", what="SIRTA")
+            .build()
+        )
+        panels.append(
+            TimeSeries(
+                title=f"parameter_{i} [unit]",
+                dataSource="default",
+                targets=[Target(expr=flux_query, datasource="InfluxDB")],
+                gridPos=GridPos(h=8, w=16, x=0, y=0),
+            )
+        )
+    dashboard = Dashboard(
+        title="CHM15K",
+        description="Ceilometer",
+        tags=["CHM15K"],
+        timezone="browser",
+        panels=panels,
+    ).auto_panel_ids()
+    return {"dashboard": dashboard.to_json_data(), "overwrite": True, "folderUid": "abc"}
+
+
+def measure(func: Callable, payload: Dict[Any, Any], number: int):
+    seconds = min(timeit.repeat(lambda: func(payload), number=number, repeat=5)) / number
+    tracemalloc.start()
+    func(payload)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds, peak
+
+
+def main():
+    print(f"{'panels':>7} {'roundtrip (ms)':>15} {'single pass (ms)':>17} {'speedup':>8} {'peak ratio':>11}")
+    for nb_panels in [10, 50, 200, 1000]:
+        payload = build_dashboard_payload(nb_panels)
+        assert get_encodable_dict(payload) == get_encodable_dict_roundtrip(payload)
+
+        number = max(1, 2000 // nb_panels)
+        roundtrip_s, roundtrip_peak = measure(get_encodable_dict_roundtrip, payload, number)
+        single_s, single_peak = measure(get_encodable_dict, payload, number)
+        print(
+            f"{nb_panels:>7} {roundtrip_s * 1000:>15.2f} {single_s * 1000:>17.2f}"
+            f" {roundtrip_s / single_s:>7.1f}x {single_peak / roundtrip_peak:>11.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
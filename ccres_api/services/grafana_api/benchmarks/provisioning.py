@@ -0,0 +1,65 @@
+"""
+Throughput of the provisioning against a fake Grafana with a fixed latency
+
+Pushes the same dashboards and folders with a plain `requests.Session` (one call after
+the other) and with `GrafanaClient` for several `max_workers`, then with injected errors.
+Run from the ccres_api directory with
+
+    python -m services.grafana_api.benchmarks.provisioning
+"""
+import time
+from typing import Callable
+
+import requests
+
+from services.grafana_api.addons.folder import Folder
+from services.grafana_api.benchmarks.encoder import build_dashboard_payload
+from services.grafana_api.client import GrafanaClient
+from services.grafana_api.dashboard_manager import DashboardManager
+from services.grafana_api.fake_server import FakeGrafanaServer
+from services.grafana_api.folder_manager import FolderManager
+
+NB_STATIONS = 50
+DASHBOARDS_PER_STATION = 4
+LATENCY = 0.01
+
+
+def push_fleet(url: str, session: requests.Session):
+    folder_manager = FolderManager(url, session)
+    for station in range(NB_STATIONS):
+        folder_manager.add_folder(Folder(f"station{station}"))
+    folder_manager.push()
+
+    dashboard = build_dashboard_payload(20)["dashboard"]
+    dashboard_manager = DashboardManager(url, session)
+    for station in range(NB_STATIONS):
+        for model in range(DASHBOARDS_PER_STATION):
+            dashboard_manager.add_dashboard({**dashboard, "title": f"MODEL{model}"}, folder_uid=f"folder{station}")
+    dashboard_manager.push()
+
+
+def run(label: str, grafana: FakeGrafanaServer, make_session: Callable[[], requests.Session]):
+    grafana.clear()
+    start = time.perf_counter()
+    push_fleet(grafana.url, make_session())
+    seconds = time.perf_counter() - start
+    nb_objects = NB_STATIONS * (1 + DASHBOARDS_PER_STATION)
+    assert len(grafana.dashboards) == NB_STATIONS * DASHBOARDS_PER_STATION
+    print(f"{label:<28} {seconds:>8.2f} {nb_objects / seconds:>10.0f} {grafana.count():>7}")
+
+
+def main():
+    nb_dashboards = NB_STATIONS * DASHBOARDS_PER_STATION
+    print(f"{NB_STATIONS} folders and {nb_dashboards} dashboards, {LATENCY * 1000:.0f} ms per call")
+    print(f"{'session':<28} {'seconds':>8} {'objects/s':>10} {'calls':>7}")
+    with FakeGrafanaServer(latency=LATENCY) as grafana:
+        run("requests.Session", grafana, requests.Session)
+        for max_workers in [1, 4, 8, 16]:
+            run(f"GrafanaClient({max_workers} workers)", grafana, lambda: GrafanaClient(max_workers=max_workers))
+
+    with FakeGrafanaServer(latency=LATENCY, error_rate=0.05) as grafana:
+        run("GrafanaClient(8), 5% of 503", grafana, lambda: GrafanaClient(max_workers=8, backoff_factor=0.01))
+
+
+if __name__ == "__main__":
+    main()
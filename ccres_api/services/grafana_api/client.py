@@ -0,0 +1,88 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Sequence, TypeVar
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+logger = logging.getLogger(__name__)
+
+
+class GrafanaClient(requests.Session):
+    """Long-lived session to talk to Grafana
+
+    Meant to be created once and shared by all the managers :
+    - the connections are kept alive in a pool
+    - 429 and 5xx responses are retried with an exponential backoff
+      (every call we make to Grafana is idempotent, so POST are retried too)
+    - every call is timed and logged at the DEBUG level
+    - `max_workers` bounds the number of independent pushes run concurrently
+
+    Parameters
+    ----------
+    pool_maxsize : int, by default 10
+        Number of connections kept alive
+    max_retries : int, by default 3
+        Number of retries on 429/5xx or connection errors
+    backoff_factor : float, by default 0.5
+        Sleep between retries is backoff_factor * 2 ** (retry - 1) seconds
+    timeout : float, by default 30
+        Timeout of a call in seconds
+    max_workers : int, by default 8
+        Maximum number of calls made concurrently by `map_concurrently`
+    """
+
+    def __init__(
+        self,
+        pool_maxsize: int = 10,
+        max_retries: int = 3,
+        backoff_factor: float = 0.5,
+        timeout: float = 30,
+        max_workers: int = 8,
+    ):
+        super().__init__()
+        retry = Retry(
+            total=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=None,
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_maxsize=pool_maxsize, max_retries=retry)
+        self.mount("http://", adapter)
+        self.mount("https://", adapter)
+        self.timeout = timeout
+        self.max_workers = max_workers
+
+    def request(self, method: str, url: str, *args: Any, **kwargs: Any) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        start = time.perf_counter()
+        response = super().request(method, url, *args, **kwargs)
+        logger.debug(
+            "%s %s [%s] in %.1f ms",
+            method,
+            url,
+            response.status_code,
+            (time.perf_counter() - start) * 1000,
+        )
+        return response
+
+
+def map_concurrently(session: requests.Session, func: Callable[[T], R], items: Sequence[T]) -> List[R]:
+    """Apply func to every item, concurrently when the session allows it
+
+    The results keep the order of the items. The first exception raised by func is re-raised.
+    A plain `requests.Session` has no `max_workers`, the items are then processed one by one.
+    """
+    max_workers = min(getattr(session, "max_workers", 1), len(items))
+    if max_workers <= 1:
+        return [func(item) for item in items]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(func, items))
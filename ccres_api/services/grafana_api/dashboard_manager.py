@@ -3,38 +3,53 @@ from typing import Any, Dict, Union
 import requests
 from .addons.contact import ContactPoint
 from .addons.notification_policies import Notification
-from .base import AcceptableCodes, get_encodable_dict
+from .base import AcceptableCodes, get_encodable_dict, LazyFetchMixin
+from .client import map_concurrently
 from grafanalib.core import Dashboard
-from typing import Optional, List
+from typing import Optional, List, Protocol, Tuple
 import datetime as dt
+import hashlib
+import json
 
 
-class DashboardManager:
+class HashStore(Protocol):
+    """Where the hash of the last pushed content of each dashboard is kept"""
+
+    def get(self, key: str) -> Optional[str]:
+        ...
+
+    def set(self, key: str, value: str) -> None:
+        ...
+
+
+def get_dashboard_hash(folder_uid: str, dashboard: Dict[Any, Any]) -> str:
+    """Stable hash of the content of a dashboard and of its folder"""
+    content = json.dumps(
+        {"folderUid": folder_uid, "dashboard": dashboard}, sort_keys=True, separators=(",", ":")
+    )
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+class DashboardManager(LazyFetchMixin):
     """Class that handle the creation of dahsboard
 
     We can add multiple dashboards and then push
     to the grafana
+
+    When a `hash_store` is given, a dashboard is only pushed when its content differs
+    from the last successful push, so unchanged dashboards do not get a new version in Grafana.
     """
 
-    def __init__(self, url: str, session: requests.Response):
+    def __init__(
+        self, url: str, session: requests.Response, hash_store: Optional[HashStore] = None
+    ):
         self.url = url
         self.session = session
         self.endpoint = f"{self.url}/dashboards/db/"
-        self.fetched_json: Dict[Any, Any] = self.fetch()
+        self.fetch_endpoint = f"{self.url}/search/?query=%"
+        self.hash_store = hash_store
         self._dashboards = []
 
-    def get_fetched_json(self) -> Any:
-        return self.fetched_json
-
-    def fetch(self) -> Dict[Any, Any]:
-        res = self.session.get(f"{self.url}/search/?query=%")
-        if res.status_code not in AcceptableCodes.list():
-            msg = "Unable to get the current configuration\n"
-            msg += f"[{res.status_code}] : {res.content}"
-            raise requests.HTTPError(msg)
-        self.fetched_json = res.json()
-        return self.fetched_json
-
     def add_dashboard(
         self, dashboard: Union[Dashboard, Dict[Any, Any]], folder_uid: Optional[str] = None
     ) -> "DashboardManager":
@@ -48,21 +63,49 @@ class DashboardManager:
 
         return self
 
-    def push(self) -> List[requests.Response]:
-        responses = []
-        for folder_uid, dashboard in self._dashboards:
-            json_d = {
-                "dashboard": dashboard,
-                "overwrite": True,
-                "folderUid": folder_uid,
-                "message": f"Updated from API at {dt.datetime.now().isoformat()}",
-            }
-
-            json_d = get_encodable_dict(json_d)
-
-            res: requests.Response = self.session.post(self.endpoint, json=json_d)
-            if res.status_code not in AcceptableCodes.list():
-                msg = f"[{res.status_code}] : {res.content}"
-                raise requests.HTTPError(msg)
-            responses.append(res)
-        return responses
+    def _push_dashboard(
+        self, folder_dashboard: Tuple[str, Dict[Any, Any]], force: bool = False
+    ) -> Optional[requests.Response]:
+        folder_uid, dashboard = folder_dashboard
+        dashboard = get_encodable_dict(dashboard)
+
+        hash_key = f"{folder_uid}/{dashboard.get('uid') or dashboard.get('title')}"
+        content_hash = get_dashboard_hash(folder_uid, dashboard)
+        if self.hash_store is not None and not force:
+            if self.hash_store.get(hash_key) == content_hash:
+                return None
+
+        json_d = {
+            "dashboard": dashboard,
+            "overwrite": True,
+            "folderUid": folder_uid,
+            "message": f"Updated from API at {dt.datetime.now().isoformat()}",
+        }
+
+        res: requests.Response = self.session.post(self.endpoint, json=json_d)
+        if res.status_code not in AcceptableCodes.list():
+            msg = f"[{res.status_code}] : {res.content}"
+            raise requests.HTTPError(msg)
+
+        if self.hash_store is not None:
+            self.hash_store.set(hash_key, content_hash)
+        return res
+
+    def push(self, force: bool = False) -> List[requests.Response]:
+        """Push the dashboards, concurrently when the session is a GrafanaClient
+
+        Parameters
+        ----------
+        force : bool, by default False
+            Push the dashboards even if their content did not change since the last push
+
+        Returns
+        -------
+        List[requests.Response]
+            Responses of the dashboards actually pushed
+        """
+        responses = map_concurrently(
+            self.session, lambda item: self._push_dashboard(item, force=force), self._dashboards
+        )
+        self.invalidate()
+        return [res for res in responses if res is not None]
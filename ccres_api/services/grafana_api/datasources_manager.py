@@ -1,10 +1,10 @@
 from typing import Any, Dict
 
 import requests
-from .base import AcceptableCodes
+from .base import LazyFetchMixin
 
 
-class DatasourceManager:
+class DatasourceManager(LazyFetchMixin):
     """Class that handle the creation of contact point and notification policy
 
     We can add multiple contact points or notification policies and then we push
@@ -15,17 +15,12 @@ class DatasourceManager:
         self.url = url
         self.session = session
         self.endpoint = f"{self.url}/datasources/"
-        self.fetched_json: Dict[Any, Any] = self.fetch()
-        self.to_push_json = self.fetched_json.copy()
+        self.fetch_endpoint = self.endpoint
+        self._to_push_json = None
 
-    def get_fetched_json(self) -> Dict[Any, Any]:
-        return self.fetched_json
-
-    def fetch(self) -> Dict[Any, Any]:
-        res = self.session.get(self.endpoint)
-        if res.status_code not in AcceptableCodes.list():
-            msg = "Unable to get the current configuration\n"
-            msg += f"[{res.status_code}] : {res.content}"
-            raise requests.HTTPError(msg)
-        self.fetched_json = res.json()
-        return self.fetched_json
+    @property
+    def to_push_json(self) -> Dict[Any, Any]:
+        """Configuration to push, copied from the fetched one the first time it is needed"""
+        if self._to_push_json is None:
+            self._to_push_json = self.fetched_json.copy()
+        return self._to_push_json
@@ -0,0 +1,426 @@
+"""
+Local HTTP server standing in for the Grafana API in the tests and the benchmarks
+
+It implements, in memory, the endpoints used by the managers and the migrators:
+folders, search, dashboards, datasources, the ruler and the alertmanager configuration.
+Every call is recorded, so a test can assert how many calls a sync made, and a latency
+and errors can be injected to benchmark or load-test the provisioning offline.
+
+```python
+    with FakeGrafanaServer(latency=0.02) as grafana:
+        grafana.inject_error(503, "POST", "/api/folders")
+        manager = FolderManager(grafana.url, GrafanaClient())
+        manager.add_folder(Folder("station")).push()
+        assert grafana.count("POST", "/api/folders") == 2  # retried once
+```
+"""
+import dataclasses
+import itertools
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+DEFAULT_DATASOURCES = [{"name": "InfluxDB", "uid": "influxdb", "type": "influxdb"}]
+RULER_PREFIX = "/api/ruler/grafana/api/v1/rules"
+ALERTMANAGER_CONFIG = "/api/alertmanager/grafana/config/api/v1/alerts"
+
+Reply = Tuple[int, Any]
+# Units of the Prometheus durations returned by Grafana, the years and weeks only when exact
+PROMETHEUS_UNITS = [
+    ("y", 365 * 86400, True),
+    ("w", 7 * 86400, True),
+    ("d", 86400, False),
+    ("h", 3600, False),
+    ("m", 60, False),
+    ("s", 1, False),
+]
+
+
+def _prometheus_duration(value: Any) -> Any:
+    """Format a duration in seconds ("600s") the way Grafana returns it ("10m")"""
+    if not isinstance(value, str) or not value.endswith("s") or not value[:-1].isdigit():
+        return value
+    seconds = int(value[:-1])
+    if seconds == 0:
+        return "0s"
+    formatted = ""
+    for unit, size, exact in PROMETHEUS_UNITS:
+        if exact and seconds % size:
+            continue
+        if seconds >= size:
+            formatted += f"{seconds // size}{unit}"
+            seconds %= size
+    return formatted
+
+
+@dataclasses.dataclass
+class RecordedCall:
+    method: str
+    path: str
+    body: Any
+
+
+@dataclasses.dataclass
+class _InjectedError:
+    status: int
+    method: Optional[str]
+    path_prefix: str
+    times: int
+
+    def matches(self, method: str, path: str) -> bool:
+        return (self.method is None or self.method == method) and path.startswith(self.path_prefix)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # Keep-alive, like Grafana, so the connection pool of the client is exercised
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    server: "_Server"
+
+    def log_message(self, format: str, *args: Any):
+        # Keep the test output clean
+        pass
+
+    def _handle(self):
+        url = urlsplit(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        raw_body = self.rfile.read(length) if length else b""
+        body = json.loads(raw_body) if raw_body else None
+
+        fake = self.server.fake
+        status, payload = fake.handle(self.command, url.path, parse_qs(url.query), body)
+
+        content = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    do_GET = _handle
+    do_POST = _handle
+    do_PUT = _handle
+    do_DELETE = _handle
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    fake: "FakeGrafanaServer"
+
+
+class FakeGrafanaServer:
+    """Fake Grafana listening on a free local port
+
+    Parameters
+    ----------
+    datasources : Optional[List[Dict[str, Any]]]
+        Datasources already existing, by default one InfluxDB datasource
+    latency : float, by default 0
+        Seconds waited before answering each call, the calls are served concurrently
+    error_rate : float, by default 0
+        Share of the calls answered with a 503 before being handled
+    seed : int, by default 0
+        Seed of the random generator drawing the errors of `error_rate`
+    """
+
+    def __init__(
+        self,
+        datasources: Optional[List[Dict[str, Any]]] = None,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        seed: int = 0,
+    ):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.calls: List[RecordedCall] = []
+        self.folders: Dict[str, Dict[str, Any]] = {}
+        self.dashboards: Dict[str, Dict[str, Any]] = {}
+        self.datasources: List[Dict[str, Any]] = []
+        self.rules: Dict[str, List[Dict[str, Any]]] = {}
+        # uid -> (group name, title) and title -> uid of the rules of each folder
+        self._rule_locations: Dict[str, Dict[str, Tuple[str, str]]] = {}
+        self._rule_titles: Dict[str, Dict[str, str]] = {}
+        self.alertmanager_config: Dict[str, Any] = {}
+        self._initial_datasources = DEFAULT_DATASOURCES if datasources is None else datasources
+        self._errors: List[_InjectedError] = []
+        self._random = random.Random(seed)
+        self._rule_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._server: Optional[_Server] = None
+        self._thread: Optional[threading.Thread] = None
+        self.clear()
+
+    @property
+    def url(self) -> str:
+        """Base URL of the API, to use as `GRAFANA_API_URL`"""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/api"
+
+    def start(self) -> "FakeGrafanaServer":
+        self._server = _Server(("127.0.0.1", 0), _Handler)
+        self._server.fake = self
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self) -> "FakeGrafanaServer":
+        return self.start()
+
+    def __exit__(self, *exc_info: Any):
+        self.stop()
+
+    # Recording and injection
+
+    def reset(self):
+        """Forget the recorded calls"""
+        with self._lock:
+            self.calls = []
+
+    def clear(self):
+        """Forget the recorded calls, the injected errors and everything created in Grafana"""
+        with self._lock:
+            self.calls = []
+            self._errors = []
+            self.folders = {}
+            self.dashboards = {}
+            self.datasources = [
+                {"id": i, **datasource} for i, datasource in enumerate(self._initial_datasources, 1)
+            ]
+            self.rules = {}
+            self._rule_locations = {}
+            self._rule_titles = {}
+            self.alertmanager_config = {
+                "alertmanager_config": {"receivers": [], "route": {"routes": []}},
+                "template_files": {},
+            }
+
+    def count(self, method: Optional[str] = None, path_prefix: str = "") -> int:
+        """Number of recorded calls, optionally only of a method and under a path"""
+        with self._lock:
+            return sum(
+                1
+                for call in self.calls
+                if (method is None or call.method == method) and call.path.startswith(path_prefix)
+            )
+
+    def inject_error(self, status: int, method: Optional[str] = None, path_prefix: str = "", times: int = 1):
+        """Answer the next `times` matching calls with `status` instead of handling them"""
+        with self._lock:
+            self._errors.append(_InjectedError(status, method, path_prefix, times))
+
+    def _injected_error(self, method: str, path: str) -> Optional[int]:
+        for error in self._errors:
+            if error.times > 0 and error.matches(method, path):
+                error.times -= 1
+                return error.status
+        if self.error_rate and self._random.random() < self.error_rate:
+            return 503
+        return None
+
+    # Routing
+
+    def handle(self, method: str, path: str, query: Dict[str, List[str]], body: Any) -> Reply:
+        if self.latency:
+            time.sleep(self.latency)
+
+        with self._lock:
+            self.calls.append(RecordedCall(method, path, body))
+            status = self._injected_error(method, path)
+            if status is not None:
+                return status, {"message": "injected error"}
+
+            path = path.rstrip("/")
+            if path.startswith("/api/folders"):
+                return self._folders(method, body)
+            if path.startswith("/api/search"):
+                return self._search(method, query)
+            if path.startswith("/api/dashboards"):
+                return self._dashboards(method, path, body)
+            if path.startswith("/api/datasources"):
+                return self._datasources(method, path, body)
+            if path.startswith(RULER_PREFIX):
+                return self._ruler(method, path, body)
+            if path == ALERTMANAGER_CONFIG:
+                return self._alertmanager(method, body)
+            if path == "/api/v1/provisioning/contact-points" and method == "POST":
+                return 202, body
+            return 404, {"message": "Not found"}
+
+    def _folders(self, method: str, body: Any) -> Reply:
+        if method == "GET":
+            return 200, list(self.folders.values())
+        if method != "POST":
+            return 405, {"message": "Method not allowed"}
+        if body["title"] in self.folders:
+            return 409, {"message": "a folder with the same name already exists"}
+        folder_id = len(self.folders) + 1
+        folder = {"id": folder_id, "uid": body.get("uid") or f"folder{folder_id}", "title": body["title"]}
+        self.folders[body["title"]] = folder
+        return 200, folder
+
+    def _search(self, method: str, query: Dict[str, List[str]]) -> Reply:
+        if method != "GET":
+            return 405, {"message": "Method not allowed"}
+        folders_by_uid = {folder["uid"]: folder for folder in self.folders.values()}
+        hits = [
+            {"id": folder["id"], "uid": folder["uid"], "title": folder["title"], "type": "dash-folder"}
+            for folder in self.folders.values()
+        ]
+        for uid, stored in self.dashboards.items():
+            folder = folders_by_uid.get(stored["meta"]["folderUid"], {})
+            hits.append(
+                {
+                    "id": stored["dashboard"]["id"],
+                    "uid": uid,
+                    "title": stored["dashboard"].get("title"),
+                    "type": "dash-db",
+                    "folderUid": folder.get("uid"),
+                    "folderId": folder.get("id"),
+                }
+            )
+        if "type" in query:
+            hits = [hit for hit in hits if hit["type"] in query["type"]]
+        if "folderIds" in query:
+            hits = [hit for hit in hits if str(hit.get("folderId")) in query["folderIds"]]
+        return 200, hits
+
+    def _dashboards(self, method: str, path: str, body: Any) -> Reply:
+        if method == "POST" and path == "/api/dashboards/db":
+            dashboard = dict(body["dashboard"])
+            folder_uid = body.get("folderUid") or ""
+            uid = dashboard.get("uid") or f"{folder_uid}-{dashboard.get('title')}"
+            previous = self.dashboards.get(uid)
+            version = previous["dashboard"]["version"] + 1 if previous else 1
+            dashboard_id = previous["dashboard"]["id"] if previous else len(self.dashboards) + 1
+            dashboard.update({"uid": uid, "id": dashboard_id, "version": version})
+            self.dashboards[uid] = {"dashboard": dashboard, "meta": {"folderUid": folder_uid}}
+            return 200, {"status": "success", "uid": uid, "id": dashboard_id, "version": version}
+        if method == "GET" and path.startswith("/api/dashboards/uid/"):
+            stored = self.dashboards.get(unquote(path.rsplit("/", 1)[1]))
+            return (200, stored) if stored else (404, {"message": "Dashboard not found"})
+        return 404, {"message": "Not found"}
+
+    def _datasources(self, method: str, path: str, body: Any) -> Reply:
+        if path == "/api/datasources":
+            if method == "GET":
+                return 200, self.datasources
+            if method != "POST":
+                return 405, {"message": "Method not allowed"}
+            if any(datasource["name"] == body["name"] for datasource in self.datasources):
+                return 409, {"message": "data source with the same name already exists"}
+            datasource = {**body, "id": len(self.datasources) + 1}
+            datasource.setdefault("uid", f"datasource{datasource['id']}")
+            self.datasources.append(datasource)
+            return 200, {"datasource": datasource, "id": datasource["id"], "message": "Datasource added"}
+
+        key, field = unquote(path.rsplit("/", 1)[1]), "id"
+        if path.startswith("/api/datasources/name/"):
+            field = "name"
+        elif path.startswith("/api/datasources/uid/"):
+            field = "uid"
+        for datasource in self.datasources:
+            if str(datasource.get(field)) == key:
+                return 200, datasource
+        return 404, {"message": "Data source not found"}
+
+    def _ruler(self, method: str, path: str, body: Any) -> Reply:
+        parts = [unquote(part) for part in path[len(RULER_PREFIX) :].split("/") if part]
+        if method == "GET":
+            if not parts:
+                return 200, {folder: groups for folder, groups in self.rules.items() if groups}
+            return 200, {parts[0]: self.rules.get(parts[0], [])}
+        if method == "POST" and len(parts) == 1:
+            return self._post_rule_group(parts[0], body)
+        if method == "DELETE" and len(parts) == 1:
+            self.rules.pop(parts[0], None)
+            self._index_rules(parts[0])
+            return 202, {"message": "rules deleted"}
+        if method == "DELETE" and len(parts) == 2:
+            groups = self.rules.get(parts[0], [])
+            remaining = [group for group in groups if group["name"] != parts[1]]
+            if len(remaining) == len(groups):
+                return 404, {"message": "rule group not found"}
+            self.rules[parts[0]] = remaining
+            self._index_rules(parts[0])
+            return 202, {"message": "rule group deleted"}
+        return 404, {"message": "Not found"}
+
+    def _post_rule_group(self, folder: str, body: Any) -> Reply:
+        """Replace the group of the same name, like Grafana: a rule sent with the uid of a rule of
+        another group of the folder moves it, a rule sent with an unknown uid is refused and a new
+        rule must not reuse the title of another one.
+        The durations are stored in the format Grafana returns them, "600s" becomes "10m"."""
+        groups = {group["name"]: group for group in self.rules.setdefault(folder, [])}
+        locations = self._rule_locations.setdefault(folder, {})
+        titles = self._rule_titles.setdefault(folder, {})
+
+        rules = body.get("rules", [])
+        sent_uids = {rule["grafana_alert"].get("uid") for rule in rules} - {None}
+        unknown_uids = sent_uids - locations.keys()
+        if unknown_uids:
+            message = f"failed to update rule with UID {min(unknown_uids)}: rule not found"
+            return 404, {"message": message}
+        for rule in rules:
+            owner = titles.get(rule["grafana_alert"]["title"])
+            if owner is not None and owner not in sent_uids and locations[owner][0] != body["name"]:
+                message = "a conflicting alert rule is found: rule title under the same folder should be unique"
+                return 400, {"message": message}
+
+        group = json.loads(json.dumps(body))
+        if "interval" in group:
+            group["interval"] = _prometheus_duration(group["interval"])
+        for rule in group.get("rules", []):
+            rule["grafana_alert"].setdefault("uid", f"rule{next(self._rule_ids)}")
+            if "for" in rule:
+                rule["for"] = _prometheus_duration(rule["for"])
+
+        # Forget the rules of the replaced group and take the moved ones out of their group
+        moved_uids = {uid: locations[uid][0] for uid in sent_uids if locations[uid][0] != group["name"]}
+        previous = groups.get(group["name"], {"rules": []})
+        for rule in previous.get("rules", []):
+            self._forget_rule(folder, rule["grafana_alert"]["uid"])
+        for uid, group_name in moved_uids.items():
+            other = groups[group_name]
+            other["rules"] = [rule for rule in other["rules"] if rule["grafana_alert"]["uid"] != uid]
+            self._forget_rule(folder, uid)
+
+        groups[group["name"]] = group
+        for rule in group.get("rules", []):
+            self._remember_rule(folder, group["name"], rule)
+        self.rules[folder] = [other for other in groups.values() if other.get("rules")]
+        return 202, {"message": "rule group updated successfully"}
+
+    def _remember_rule(self, folder: str, group_name: str, rule: Dict[str, Any]):
+        uid, title = rule["grafana_alert"]["uid"], rule["grafana_alert"]["title"]
+        self._rule_locations[folder][uid] = (group_name, title)
+        self._rule_titles[folder][title] = uid
+
+    def _forget_rule(self, folder: str, uid: str):
+        _, title = self._rule_locations[folder].pop(uid)
+        if self._rule_titles[folder].get(title) == uid:
+            del self._rule_titles[folder][title]
+
+    def _index_rules(self, folder: str):
+        """Index the rules of the folder by uid and by title, the ruler checks them on every POST"""
+        self._rule_locations[folder] = {}
+        self._rule_titles[folder] = {}
+        for group in self.rules.get(folder, []):
+            for rule in group.get("rules", []):
+                self._remember_rule(folder, group["name"], rule)
+
+    def _alertmanager(self, method: str, body: Any) -> Reply:
+        if method == "GET":
+            return 200, json.loads(json.dumps(self.alertmanager_config))
+        if method == "POST":
+            self.alertmanager_config = body
+            return 202, {"message": "configuration created"}
+        return 405, {"message": "Method not allowed"}
@@ -3,10 +3,11 @@ from typing import Any, Dict, Union, List
 import requests
 from .addons.folder import Folder
 from .addons.notification_policies import Notification
-from .base import AcceptableCodes, get_encodable_dict
+from .base import AcceptableCodes, get_encodable_dict, LazyFetchMixin
+from .client import map_concurrently
 
 
-class FolderManager:
+class FolderManager(LazyFetchMixin):
     """Class that handle the creation of folder
 
     We can add multiple folders and then push
@@ -17,21 +18,9 @@ class FolderManager:
         self.url = url
         self.session = session
         self.endpoint = f"{self.url}/folders/"
-        self.fetched_json: Dict[Any, Any] = self.fetch()
+        self.fetch_endpoint = self.endpoint
         self._folders = []
 
-    def get_fetched_json(self) -> Any:
-        return self.fetched_json
-
-    def fetch(self) -> Dict[Any, Any]:
-        res = self.session.get(self.endpoint)
-        if res.status_code not in AcceptableCodes.list():
-            msg = "Unable to get the current configuration\n"
-            msg += f"[{res.status_code}] : {res.content}"
-            raise requests.HTTPError(msg)
-        self.fetched_json = res.json()
-        return self.fetched_json
-
     def add_folder(self, folder: Union[Folder, Dict[Any, Any]]) -> "FolderManager":
         if isinstance(folder, Folder):
             folder_dict = folder.to_json_data()
@@ -42,14 +31,17 @@ class FolderManager:
 
         return self
 
+    def _push_folder(self, folder: Dict[Any, Any]) -> requests.Response:
+        json_d = get_encodable_dict(folder)
+
+        res: requests.Response = self.session.post(self.endpoint, json=json_d)
+        if res.status_code not in AcceptableCodes.list():
+            msg = f"[{res.status_code}] : {res.content}"
+            raise requests.HTTPError(msg)
+        return res
+
     def push(self) -> List[requests.Response]:
-        responses = []
-        for folder in self._folders:
-            json_d = get_encodable_dict(folder)
-
-            res: requests.Response = self.session.post(self.endpoint, json=json_d)
-            if res.status_code not in AcceptableCodes.list():
-                msg = f"[{res.status_code}] : {res.content}"
-                raise requests.HTTPError(msg)
-            responses.append(res)
+        """Push the folders, concurrently when the session is a GrafanaClient"""
+        responses = map_concurrently(self.session, self._push_folder, self._folders)
+        self.invalidate()
         return responses
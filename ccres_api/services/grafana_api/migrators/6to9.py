@@ -9,6 +9,7 @@ import sys
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
 from dotenv import load_dotenv
 from grafana_api.base import AcceptableCodes
+from grafana_api.client import GrafanaClient, map_concurrently
 
 
 class GrafanaDatasourceMigrator6to9:
@@ -38,12 +39,14 @@ class GrafanaDatasourceMigrator6to9:
         self.new_api_url = new_api_url
         self.base_datasources = self.base.get(f"{self.base_api_url}/datasources/").json()
 
+    def _migrate_datasource(self, base_datasource):
+        base_datasource_response = self.base.get(
+            f"{self.base_api_url}/datasources/{base_datasource['id']}"
+        ).json()
+        self.new.post(f"{self.new_api_url}/datasources/", json=base_datasource_response).json()
+
     def migrate(self):
-        for base_datasource in self.base_datasources:
-            base_datasource_response = self.base.get(
-                f"{self.base_api_url}/datasources/{base_datasource['id']}"
-            ).json()
-            self.new.post(f"{self.new_api_url}/datasources/", json=base_datasource_response).json()
+        map_concurrently(self.new, self._migrate_datasource, self.base_datasources)
 
 
 class GrafanaDashboardMigrator6to9:
@@ -89,7 +92,7 @@ class GrafanaDashboardMigrator6to9:
                 params={"type": "dash-db", "folderIds": folder["id"]},
             ).json()
 
-            for dashboard in dashboards:
+            def _migrate_dashboard(dashboard):
                 dashboard_response_base = self.base.get(
                     f"{self.base_api_url}/dashboards/uid/{dashboard['uid']}"
                 ).json()
@@ -102,6 +105,8 @@ class GrafanaDashboardMigrator6to9:
                     json={"dashboard": dashboard_payload, "folderUid": folder["uid"]},
                 )
 
+            map_concurrently(self.new, _migrate_dashboard, dashboards)
+
 
 class GrafanaContactMigrator6to9:
     def __init__(
@@ -319,11 +324,11 @@ def main():
     AUTH_GRAFANA_DOCKER = requests.auth.HTTPBasicAuth(
         os.environ.get("DOCKER_GRAFANA_USERNAME"), os.environ.get("DOCKER_GRAFANA_PASSWORD")
     )
-    session_from = requests.Session()
+    session_from = GrafanaClient()
     session_from.headers.update(AUTH_HEADER_GRAFANA_SIRTA)
     session_from.proxies = PROXIES_SIRTA
 
-    session_to = requests.Session()
+    session_to = GrafanaClient()
     session_to.auth = AUTH_GRAFANA_DOCKER
     session_to.headers.update({"x-disable-provenance": "true"})
     dashboard_migrator = GrafanaDashboardMigrator6to9(
@@ -1,86 +1,161 @@
-from typing import Any, Dict, Union
+import copy
+import json
+from typing import Any, Dict, List, Optional, Tuple, Union
 
 import requests
 from .addons.contact import ContactPoint
 from .addons.notification_policies import Notification
-from .base import AcceptableCodes, get_encodable_dict
+from .base import AcceptableCodes, get_encodable_dict, is_subset, LazyFetchMixin
 
+# Answered by Grafana when the configuration changed since it was fetched
+CONFLICT_CODES = (409, 412)
 
-class NotificationManager:
+
+class NotificationManager(LazyFetchMixin):
     """Class that handle the creation of contact point and notification policy
 
     We can add multiple contact points or notification policies and then we push
-    to the grafana
+    to the grafana. The changes are kept until the push: it is skipped when they do not
+    change the configuration. Grafana replaces the whole configuration on a POST and takes
+    no version to compare with, so the push fetches it again first: when it changed since
+    it was fetched (e.g. by another worker), the changes are applied on top of the new one.
+    Only a change made between that GET and the POST is still overwritten. A conflict
+    answer (409/412) is handled the same way.
     """
 
-    def __init__(self, url: str, session: requests.Response):
+    def __init__(self, url: str, session: requests.Response, max_conflict_retries: int = 3):
         self.url = url
         self.session = session
         self.endpoint = f"{self.url}/alertmanager/grafana/config/api/v1/alerts"
-        self.fetched_json: Dict[Any, Any] = self.fetch()
-        self.to_push_json = self.fetched_json.copy()
+        self.fetch_endpoint = self.endpoint
+        self.max_conflict_retries = max_conflict_retries
+        self._to_push_json = None
+        self._pending: List[Tuple[str, Optional[str], Dict[Any, Any]]] = []
+        self._receiver_index: Dict[str, int] = {}
+        self._route_index: Dict[Tuple[Any, str], int] = {}
+
+    @property
+    def to_push_json(self) -> Dict[Any, Any]:
+        """Configuration to push, copied from the fetched one the first time it is needed"""
+        if self._to_push_json is None:
+            self._to_push_json = copy.deepcopy(self.fetched_json)
+            self._build_indexes()
+        return self._to_push_json
+
+    @property
+    def has_changes(self) -> bool:
+        """Whether the pending changes differ from the fetched configuration"""
+        return self._to_push_json is not None and self._to_push_json != self.fetched_json
 
-    def get_fetched_json(self) -> Dict[Any, Any]:
-        return self.fetched_json
+    @staticmethod
+    def _route_key(route: Dict[Any, Any]) -> Tuple[Any, str]:
+        """A route is identified by its receiver and its matchers"""
+        return route.get("receiver"), json.dumps(route.get("object_matchers"), sort_keys=True)
 
-    def fetch(self) -> Dict[Any, Any]:
-        res = self.session.get(self.endpoint)
-        if res.status_code not in AcceptableCodes.list():
-            msg = "Unable to get the current configuration\n"
-            msg += f"[{res.status_code}] : {res.content}"
-            raise requests.HTTPError(msg)
-        self.fetched_json = res.json()
-        return self.fetched_json
+    def _build_indexes(self):
+        """Map the receiver names and the route keys to their position, once per fetched config"""
+        config = self._to_push_json["alertmanager_config"]
+        self._receiver_index = {
+            receiver["name"]: idx for idx, receiver in enumerate(config["receivers"]) if "name" in receiver
+        }
+        self._route_index = {
+            self._route_key(route): idx for idx, route in enumerate(config["route"].get("routes") or [])
+        }
 
     def add_contact_point(
         self, contact_point: Union[ContactPoint, Dict[Any, Any]]
     ) -> "NotificationManager":
         if isinstance(contact_point, ContactPoint):
             name = contact_point.name
-            contact_dict = contact_point.to_json_data()
+            contact_dict = get_encodable_dict(contact_point.to_json_data())
         else:
             name = contact_point["name"]
-            contact_dict = contact_point
-
-        _contact_exists = False
-        _contact_idx = 0
-        for idx, contact in enumerate(self.to_push_json["alertmanager_config"]["receivers"]):
-            if "name" not in contact:
-                continue
-            if contact["name"] == name:
-                _contact_exists = True
-                _contact_idx = idx
-
-        if not _contact_exists:
-            self.to_push_json["alertmanager_config"]["receivers"].append(
+            contact_dict = get_encodable_dict(contact_point)
+        self._pending.append(("receiver", name, contact_dict))
+        self._apply_contact_point(name, copy.deepcopy(contact_dict))
+        return self
+
+    def _apply_contact_point(self, name: str, contact_dict: Dict[Any, Any]):
+        receivers = self.to_push_json["alertmanager_config"]["receivers"]
+        idx = self._receiver_index.get(name)
+        if idx is None:
+            self._receiver_index[name] = len(receivers)
+            receivers.append(
                 {
                     "grafana_managed_receiver_configs": [contact_dict],
                     "name": name,
                 },
             )
-        else:
-            self.to_push_json["alertmanager_config"]["receivers"][_contact_idx][
-                "grafana_managed_receiver_configs"
-            ] = [contact_dict]
-
-        return self
+        elif not is_subset([contact_dict], receivers[idx].get("grafana_managed_receiver_configs")):
+            receivers[idx]["grafana_managed_receiver_configs"] = [contact_dict]
 
     def add_notification_policy(
         self, notification_policy: Union[Notification, Dict[Any, Any]]
     ) -> "NotificationManager":
         if isinstance(notification_policy, Notification):
-            notification_dict = notification_policy.to_json_data()
+            notification_dict = get_encodable_dict(notification_policy.to_json_data())
         else:
-            notification_dict = notification_policy
-        self.to_push_json["alertmanager_config"]["route"]["routes"].append(notification_dict)
+            notification_dict = get_encodable_dict(notification_policy)
+        self._pending.append(("route", None, notification_dict))
+        self._apply_notification_policy(copy.deepcopy(notification_dict))
         return self
 
-    def push(self) -> requests.Response:
-        json_d = get_encodable_dict(self.to_push_json)
-        res: requests.Response = self.session.post(self.endpoint, json=json_d)
-        if res.status_code not in AcceptableCodes.list():
-            msg = f"[{res.status_code}] : {res.content}"
-            if res.status_code == 400:
-                msg += "\nMaybe the contact point does not exist ?"
-            raise requests.HTTPError(msg)
+    def _apply_notification_policy(self, notification_dict: Dict[Any, Any]):
+        route = self.to_push_json["alertmanager_config"]["route"]
+        if route.get("routes") is None:
+            route["routes"] = []
+        routes = route["routes"]
+        key = self._route_key(notification_dict)
+        idx = self._route_index.get(key)
+        if idx is None:
+            self._route_index[key] = len(routes)
+            routes.append(notification_dict)
+        elif not is_subset(notification_dict, routes[idx]):
+            routes[idx] = notification_dict
+
+    def _is_stale(self) -> bool:
+        """Fetch the configuration again, whether it changed since the previous fetch"""
+        snapshot = self.fetched_json
+        self.invalidate()
+        return self.fetched_json != snapshot
+
+    def _reapply(self):
+        """Apply the pending changes on top of the configuration fetched last"""
+        self._to_push_json = None
+        for kind, name, change in self._pending:
+            if kind == "receiver":
+                self._apply_contact_point(name, copy.deepcopy(change))
+            else:
+                self._apply_notification_policy(copy.deepcopy(change))
+
+    def push(self) -> Optional[requests.Response]:
+        """Push the configuration if the pending changes modify it
+
+        Returns None when there is nothing to push.
+        """
+        res = None
+        for attempt in range(self.max_conflict_retries + 1):
+            if not self.has_changes:
+                break
+            if self._is_stale():
+                if attempt < self.max_conflict_retries:
+                    self._reapply()
+                    continue
+                raise requests.HTTPError("Configuration modified concurrently")
+            res = self.session.post(self.endpoint, json=self.to_push_json)
+            if res.status_code in CONFLICT_CODES:
+                if attempt < self.max_conflict_retries:
+                    self.invalidate()
+                    self._reapply()
+                    continue
+                raise requests.HTTPError(f"Configuration modified concurrently [{res.status_code}] : {res.content}")
+            if res.status_code not in AcceptableCodes.list():
+                msg = f"[{res.status_code}] : {res.content}"
+                if res.status_code == 400:
+                    msg += "\nMaybe the contact point does not exist ?"
+                raise requests.HTTPError(msg)
+            break
+        self.invalidate()
+        self._to_push_json = None
+        self._pending = []
         return res
@@ -11,7 +11,7 @@ from users.permissions import IsEditor
 User = get_user_model()
 
 class UserList(ListCreateAPIView):
-    queryset = User.objects.all()
+    queryset = User.objects.prefetch_related("groups", "user_permissions")
     serializer_class = UserSerializer
     permission_classes = [IsAdminUser]
 
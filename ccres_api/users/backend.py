@@ -2,20 +2,23 @@ from django.contrib.auth.models import Group
 
 
 def save_group(backend, user, response, *args, **kwargs):
-    """Map keycloak groups to django groups and add the user to them."""
+    """Map keycloak groups to django groups and sync the memberships of the user with them."""
     if backend.name == "keycloak":
         keycloak_groups = response.get("keycloak_groups")
-        if not keycloak_groups:
+        # No claim, the memberships are left as they are. An empty list removes them all.
+        if not isinstance(keycloak_groups, list):
             return
 
-        if not isinstance(keycloak_groups, list):
+        desired_names = {keycloak_group.lower() for keycloak_group in keycloak_groups}
+        current_groups = {group.name: group for group in user.groups.all()}
+        missing_names = desired_names - current_groups.keys()
+        extra_groups = [group for name, group in current_groups.items() if name not in desired_names]
+        if not missing_names and not extra_groups:
             return
 
-        current_groups = user.groups.all()
-        current_groups_name = [group.name for group in current_groups]
-        for keycloak_group in keycloak_groups:
-            if keycloak_group.lower() in current_groups_name:
-                continue
-            group = Group.objects.create(name=keycloak_group.lower())
-            user.groups.add(group)
-            user.save()
+        if missing_names:
+            # Another login may create the same groups concurrently
+            Group.objects.bulk_create([Group(name=name) for name in missing_names], ignore_conflicts=True)
+            user.groups.add(*Group.objects.filter(name__in=missing_names))
+        if extra_groups:
+            user.groups.remove(*extra_groups)
@@ -0,0 +1,37 @@
+"""
+Cached group names of the users
+
+The permission checks read the group names of the user from the Django cache (Redis in
+production) instead of querying the database on every request. The entry of a user is
+deleted by the signals of `users.signals` whenever their memberships change, and expires after
+`USERS_GROUP_NAMES_CACHE_TTL` seconds in case an invalidation was missed.
+"""
+from typing import FrozenSet, Iterable
+
+from django.conf import settings
+from django.core.cache import cache
+
+GROUP_NAMES_KEY = "users:group-names:{}"
+
+
+def get_group_names(user) -> FrozenSet[str]:
+    """Names of the groups of the user, without any query once cached"""
+    if user is None or user.pk is None:
+        return frozenset()
+
+    # Also kept on the user object, for the checks made during the same request
+    group_names = getattr(user, "_cached_group_names", None)
+    if group_names is not None:
+        return group_names
+
+    key = GROUP_NAMES_KEY.format(user.pk)
+    group_names = cache.get(key)
+    if group_names is None:
+        group_names = frozenset(user.groups.values_list("name", flat=True))
+        cache.set(key, group_names, settings.USERS_GROUP_NAMES_CACHE_TTL)
+    user._cached_group_names = group_names
+    return group_names
+
+
+def invalidate_group_names(user_ids: Iterable[int]):
+    cache.delete_many([GROUP_NAMES_KEY.format(user_id) for user_id in user_ids])
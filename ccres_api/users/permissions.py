@@ -1,6 +1,9 @@
 from rest_framework.permissions import BasePermission
+from users.groups import get_group_names
+
+EDITOR_GROUP = "editor"
 
 
 class IsEditor(BasePermission):
     def has_permission(self, request, view):
-        return request.user.groups.filter(name="Editor".lower()).exists()
+        return EDITOR_GROUP in get_group_names(request.user)
@@ -0,0 +1,46 @@
+"""
+Signals invalidating the cached group names of the users (see `users.groups`)
+"""
+from functools import partial
+from typing import Any, Iterable, Type
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_save, pre_delete
+from django.dispatch import receiver
+from users.groups import invalidate_group_names
+
+User = get_user_model()
+
+
+def invalidate_on_commit(user_ids: Iterable[int]):
+    """Invalidate once the change is committed, an earlier read would cache the old groups again"""
+    # Listed now: the members of a cleared or deleted group are only known before the change
+    transaction.on_commit(partial(invalidate_group_names, list(user_ids)))
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def invalidate_on_membership_change(sender: Type, instance: Any, action: str, reverse: bool, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear", "pre_clear"):
+        return
+    if not reverse:
+        # user.groups.add/remove/clear
+        invalidate_on_commit([instance.pk])
+    elif action == "pre_clear":
+        # group.user_set.clear(): pk_set is not given, the members are only known before
+        invalidate_on_commit(instance.user_set.values_list("pk", flat=True))
+    elif pk_set:
+        # group.user_set.add/remove
+        invalidate_on_commit(pk_set)
+
+
+@receiver(post_save, sender=Group)
+def invalidate_on_group_rename(sender: Type[Group], instance: Group, created: bool, **kwargs):
+    if not created:
+        invalidate_on_commit(instance.user_set.values_list("pk", flat=True))
+
+
+@receiver(pre_delete, sender=Group)
+def invalidate_on_group_delete(sender: Type[Group], instance: Group, **kwargs):
+    invalidate_on_commit(instance.user_set.values_list("pk", flat=True))
@@ -1,3 +1,114 @@
+"""
+Query-count and latency budgets of the users API
+"""
+import time
+from types import SimpleNamespace
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from users.backend import save_group
+
+User = get_user_model()
+
+N_USERS = 300
+MAX_QUERIES = 6
+MAX_SECONDS = 1.0
+
+
+class UsersApiBudgetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        editors = Group.objects.create(name="editor")
+        viewers = Group.objects.create(name="viewer")
+        users = User.objects.bulk_create(User(username=f"user{i}") for i in range(N_USERS))
+        User.groups.through.objects.bulk_create(
+            User.groups.through(user=user, group=editors if i % 2 else viewers) for i, user in enumerate(users)
+        )
+        cls.admin = User.objects.create(username="admin", is_staff=True, is_superuser=True)
+        cls.editor = users[1]
+        cls.editors = editors
+
+    def setUp(self):
+        cache.clear()
+
+    def assertBudget(self, url: str, user: User):
+        client = APIClient()
+        client.force_authenticate(user)
+        start = time.perf_counter()
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url)
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(len(queries), MAX_QUERIES)
+        self.assertLessEqual(elapsed, MAX_SECONDS)
+        return response
+
+    def test_user_list(self):
+        response = self.assertBudget("/api/v1/users/", self.admin)
+        self.assertEqual(len(response.json()), N_USERS + 1)
+
+    def test_user_me(self):
+        response = self.assertBudget("/api/v1/users/me", self.editor)
+        self.assertEqual(response.json()["username"], self.editor.username)
+
+    def test_editor_check_is_cached(self):
+        client = APIClient()
+        client.force_authenticate(self.editor)
+        with CaptureQueriesContext(connection) as cold:
+            client.get("/api/v1/users/me")
+        with CaptureQueriesContext(connection) as warm:
+            client.get("/api/v1/users/me")
+        self.assertEqual(len(warm), len(cold) - 1)
+
+    def test_membership_change_invalidates_the_cache(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.get(pk=self.editor.pk))
+        self.assertEqual(client.get("/api/v1/users/me").status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.editors.user_set.remove(self.editor)
+            # Still cached until the change is committed
+            client.force_authenticate(User.objects.get(pk=self.editor.pk))
+            self.assertEqual(client.get("/api/v1/users/me").status_code, 200)
+        client.force_authenticate(User.objects.get(pk=self.editor.pk))
+        self.assertEqual(client.get("/api/v1/users/me").status_code, 403)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.editor.groups.add(self.editors)
+        client.force_authenticate(User.objects.get(pk=self.editor.pk))
+        self.assertEqual(client.get("/api/v1/users/me").status_code, 200)
+
+
+class SaveGroupTests(TestCase):
+    backend = SimpleNamespace(name="keycloak")
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username="keycloak-user")
+        cls.user.groups.add(Group.objects.create(name="viewer"), Group.objects.create(name="retired"))
+
+    def test_groups_are_synced_in_a_few_queries(self):
+        Group.objects.create(name="editor")
+        with CaptureQueriesContext(connection) as queries:
+            save_group(self.backend, self.user, {"keycloak_groups": ["Editor", "Viewer", "Operator"]})
+        self.assertEqual(set(self.user.groups.values_list("name", flat=True)), {"editor", "viewer", "operator"})
+        self.assertLessEqual(len(queries), 8)
+
+    def test_nothing_is_written_when_the_groups_match(self):
+        with CaptureQueriesContext(connection) as queries:
+            save_group(self.backend, self.user, {"keycloak_groups": ["viewer", "RETIRED"]})
+        self.assertEqual(len(queries), 1)
+
+    def test_empty_groups_remove_the_memberships(self):
+        save_group(self.backend, self.user, {"keycloak_groups": []})
+        self.assertFalse(self.user.groups.exists())
 
-# Create your tests here.
+    def test_missing_groups_keep_the_memberships(self):
+        save_group(self.backend, self.user, {})
+        self.assertEqual(set(self.user.groups.values_list("name", flat=True)), {"viewer", "retired"})